@@ -0,0 +1,97 @@
+import threading
+from array import array
+
+# Kolom matriks akumulasi (satu baris per slot sensor)
+AGG_COLUMNS = ('tegangan', 'arus', 'daya', 'energi', 'frekuensi', 'biaya', 'pf')
+AGG_WIDTH = len(AGG_COLUMNS)
+
+def _zeros(typecode: str, length: int):
+    return array(typecode, bytes(array(typecode).itemsize * length))
+
+class AggregationBuffer:
+    """
+    Buffer akumulasi berbasis array: matriks float (slot x kolom) + vektor count.
+    Drain menukar buffer aktif dengan buffer cadangan yang sudah nol (double
+    buffering), jadi tidak ada dict baru per sensor di setiap sampel maupun flush.
+    """
+
+    def __init__(self, capacity: int = 32):
+        self.lock = threading.Lock()
+        self.slots = {}          # sensor_id -> slot
+        self.sensor_ids = []     # slot -> sensor_id
+        self.capacity = capacity
+        self._sums = _zeros('d', capacity * AGG_WIDTH)
+        self._counts = _zeros('q', capacity)
+        self._spare = (_zeros('d', capacity * AGG_WIDTH), _zeros('q', capacity))
+        self._zero_sums = _zeros('d', capacity * AGG_WIDTH)
+        self._zero_counts = _zeros('q', capacity)
+
+    def _assign_slot(self, sensor_id: int):
+        slot = len(self.sensor_ids)
+        if slot == self.capacity:
+            self._grow()
+        self.slots[sensor_id] = slot
+        self.sensor_ids.append(sensor_id)
+        return slot
+
+    def _grow(self):
+        """Gandakan kapasitas slot; buffer cadangan dibuat ulang saat drain berikutnya"""
+        extra = self.capacity
+        self._sums.extend(_zeros('d', extra * AGG_WIDTH))
+        self._counts.extend(_zeros('q', extra))
+        self.capacity += extra
+        self._zero_sums = _zeros('d', self.capacity * AGG_WIDTH)
+        self._zero_counts = _zeros('q', self.capacity)
+        self._spare = None
+
+    def add(self, sensor_id: int, tegangan: float, arus: float, daya: float,
+            energi: float, frekuensi: float, biaya: float, pf: float):
+        """Tambahkan satu sampel; return jumlah sampel sensor sejak flush terakhir"""
+        with self.lock:
+            slot = self.slots.get(sensor_id)
+            if slot is None:
+                slot = self._assign_slot(sensor_id)
+            sums = self._sums
+            base = slot * AGG_WIDTH
+            sums[base] += tegangan
+            sums[base + 1] += arus
+            sums[base + 2] += daya
+            sums[base + 3] += energi
+            sums[base + 4] += frekuensi
+            sums[base + 5] += biaya
+            sums[base + 6] += pf
+            self._counts[slot] += 1
+            return self._counts[slot]
+
+    def drain(self):
+        """
+        Ambil snapshot semua slot lalu reset dalam satu langkah.
+        Return list (sensor_id, sums_tuple urut AGG_COLUMNS, count) untuk slot yang berisi.
+        """
+        with self.lock:
+            sums, counts = self._sums, self._counts
+            if self._spare is None:
+                self._spare = (_zeros('d', self.capacity * AGG_WIDTH), _zeros('q', self.capacity))
+            self._sums, self._counts = self._spare
+            self._spare = None
+            sensor_ids = list(self.sensor_ids)
+
+        rows = []
+        for slot, sensor_id in enumerate(sensor_ids):
+            count = counts[slot]
+            if count:
+                base = slot * AGG_WIDTH
+                rows.append((sensor_id, tuple(sums[base:base + AGG_WIDTH]), count))
+
+        with self.lock:
+            # buffer lama dinolkan dan dipakai lagi sebagai cadangan
+            if len(counts) == self.capacity:
+                sums[:] = self._zero_sums
+                counts[:] = self._zero_counts
+                self._spare = (sums, counts)
+        return rows
+
+    def pending(self):
+        """Total sampel yang belum diflush"""
+        with self.lock:
+            return sum(self._counts)
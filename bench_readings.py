@@ -0,0 +1,128 @@
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Benchmark skema pembacaan SQLite: format lama (timestamp TEXT + rowid +
+# idx_sensor_time) vs readings (ts epoch INTEGER, WITHOUT ROWID, primary key
+# (sensor_id, ts)). Data sintetis di direktori sementara, pzem.db tidak disentuh.
+#
+#   python bench_readings.py [hari] [interval_detik] [jumlah_sensor]
+
+LAYOUTS = {
+    "text": {
+        "schema": """
+            CREATE TABLE sensor_readings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sensor_id INTEGER NOT NULL, timestamp TEXT NOT NULL,
+                voltage REAL, current REAL, power REAL, energy REAL,
+                frequency REAL, power_factor REAL, cost REAL
+            );
+            CREATE INDEX idx_sensor_time ON sensor_readings (sensor_id, timestamp);
+        """,
+        "insert": ("INSERT INTO sensor_readings (sensor_id, timestamp, voltage, current, power, energy, "
+                   "frequency, power_factor, cost) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"),
+        "time": lambda dt: dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "range_total": ("SELECT SUM(energy), SUM(cost) FROM sensor_readings "
+                        "WHERE sensor_id = ? AND timestamp >= ? AND timestamp < ?"),
+        "hourly_avg": ("SELECT CAST(strftime('%s', timestamp) AS INTEGER) / 3600, AVG(power) FROM sensor_readings "
+                       "WHERE sensor_id = ? AND timestamp >= ? AND timestamp < ? GROUP BY 1"),
+        "hour_of_day": ("SELECT strftime('%H', timestamp), SUM(energy) FROM sensor_readings "
+                        "WHERE sensor_id = ? AND timestamp >= ? AND timestamp < ? GROUP BY 1")
+    },
+    "epoch": {
+        "schema": """
+            CREATE TABLE readings (
+                sensor_id INTEGER NOT NULL, ts INTEGER NOT NULL,
+                voltage REAL, current REAL, power REAL, energy REAL,
+                frequency REAL, power_factor REAL, cost REAL,
+                PRIMARY KEY (sensor_id, ts)
+            ) WITHOUT ROWID;
+        """,
+        "insert": ("INSERT INTO readings (sensor_id, ts, voltage, current, power, energy, "
+                   "frequency, power_factor, cost) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"),
+        "time": lambda dt: int((dt - datetime(1970, 1, 1)).total_seconds()),
+        "range_total": "SELECT SUM(energy), SUM(cost) FROM readings WHERE sensor_id = ? AND ts >= ? AND ts < ?",
+        "hourly_avg": ("SELECT ts / 3600, AVG(power) FROM readings "
+                       "WHERE sensor_id = ? AND ts >= ? AND ts < ? GROUP BY 1"),
+        "hour_of_day": ("SELECT (ts / 3600) % 24, SUM(energy) FROM readings "
+                        "WHERE sensor_id = ? AND ts >= ? AND ts < ? GROUP BY 1")
+    }
+}
+
+# (nama, query, panjang rentang, jumlah ulangan)
+QUERIES = [
+    ("range_total 1 jam", "range_total", timedelta(hours=1), 2000),
+    ("range_total 1 hari", "range_total", timedelta(days=1), 300),
+    ("hourly_avg 7 hari", "hourly_avg", timedelta(days=7), 50),
+    ("hour_of_day 30 hari", "hour_of_day", timedelta(days=30), 10)
+]
+
+
+def generate(days, interval, sensors):
+    random.seed(7)
+    start = datetime(2025, 1, 1)
+    steps = int(days * 86400 / interval)
+    for step in range(steps):
+        ts = start + timedelta(seconds=step * interval)
+        for sensor_id in range(1, sensors + 1):
+            power = random.uniform(10, 900)
+            yield (sensor_id, ts, round(random.uniform(215, 235), 3), round(power / 220, 3), round(power, 3),
+                   round(power * interval / 3.6e6, 7), round(random.uniform(49.8, 50.2), 3),
+                   round(random.uniform(0.8, 1.0), 3), round(power * interval / 3.6e6 * 1444.7, 4))
+
+
+def build(path, layout, rows):
+    conn = sqlite3.connect(path)
+    conn.executescript(layout["schema"])
+    to_time = layout["time"]
+    started = time.perf_counter()
+    conn.executemany(layout["insert"], ((r[0], to_time(r[1]), *r[2:]) for r in rows))
+    conn.commit()
+    seconds = time.perf_counter() - started
+    conn.execute("VACUUM")
+    conn.close()
+    return seconds
+
+
+def run_queries(path, layout, days, sensors):
+    conn = sqlite3.connect(path)
+    to_time = layout["time"]
+    random.seed(11)
+    results = {}
+    for name, query, span, repeat in QUERIES:
+        windows = []
+        for _ in range(repeat):
+            offset = random.uniform(0, max(0.0, days * 86400 - span.total_seconds()))
+            lo = datetime(2025, 1, 1) + timedelta(seconds=int(offset))
+            windows.append((random.randint(1, sensors), to_time(lo), to_time(lo + span)))
+        started = time.perf_counter()
+        for args in windows:
+            conn.execute(layout[query], args).fetchall()
+        results[name] = (time.perf_counter() - started) / repeat * 1000
+    conn.close()
+    return results
+
+
+def main(days=30, interval=30, sensors=21):
+    rows = list(generate(days, interval, sensors))
+    print(f"{len(rows)} baris ({sensors} sensor, {days} hari, interval {interval} detik)")
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, layout in LAYOUTS.items():
+            path = os.path.join(directory, f"{name}.db")
+            insert_sec = build(path, layout, rows)
+            report[name] = {"file_mb": os.path.getsize(path) / 1e6, "insert_sec": insert_sec,
+                            **run_queries(path, layout, days, sensors)}
+
+    print(f"{'':24}{'text':>12}{'epoch':>12}{'rasio':>9}")
+    for key, unit in [("file_mb", "MB"), ("insert_sec", "s")] + [(name, "ms") for name, *_ in QUERIES]:
+        before, after = report["text"][key], report["epoch"][key]
+        print(f"{key + ' (' + unit + ')':24}{before:12.3f}{after:12.3f}{before / after:8.2f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:4]))
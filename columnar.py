@@ -0,0 +1,128 @@
+import json
+import sys
+import threading
+import time
+from array import array
+
+try:
+    import msgpack  # encoding biner ringkas (opsional)
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow  # Arrow IPC stream (opsional)
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+MIME_JSON = "application/json"
+MIME_MSGPACK = "application/x-msgpack"
+MIME_ARROW = "application/vnd.apache.arrow.stream"
+
+# alias untuk ?format=
+FORMAT_ALIASES = {"json": MIME_JSON, "msgpack": MIME_MSGPACK, "arrow": MIME_ARROW}
+
+# typecode array per dtype kolom numerik
+TYPECODES = {"float64": "d", "int64": "q"}
+
+encode_stats = {}
+encode_stats_lock = threading.Lock()
+
+
+def available_mimetypes():
+    """Format yang bisa dilayani; JSON selalu pertama (default negosiasi)"""
+    mimetypes = [MIME_JSON]
+    if msgpack is not None:
+        mimetypes.append(MIME_MSGPACK)
+    if pyarrow is not None:
+        mimetypes.append(MIME_ARROW)
+    return mimetypes
+
+
+class ColumnBuilder:
+    """
+    Kumpulan kolom bertipe (float64/int64/string) yang diisi per baris langsung
+    dari hasil cursor, tanpa membuat dict per baris.
+    """
+
+    def __init__(self, schema):
+        self.schema = tuple(schema)          # ((nama, dtype), ...)
+        self.columns = [array(TYPECODES[dtype]) if dtype in TYPECODES else []
+                        for _, dtype in self.schema]
+
+    def append(self, *values):
+        for column, value in zip(self.columns, values):
+            column.append(value)
+
+    def extend_rows(self, rows):
+        appends = [column.append for column in self.columns]
+        for row in rows:
+            for append, value in zip(appends, row):
+                append(value)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+
+def _little_endian_bytes(column):
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+def _encode_msgpack(builder, meta):
+    columns = []
+    for (name, dtype), column in zip(builder.schema, builder.columns):
+        data = _little_endian_bytes(column) if dtype in TYPECODES else column
+        columns.append({"name": name, "dtype": dtype, "data": data})
+    return msgpack.packb({"meta": meta, "length": len(builder), "columns": columns}, use_bin_type=True)
+
+def _encode_arrow(builder, meta):
+    types = {"float64": pyarrow.float64(), "int64": pyarrow.int64(), "string": pyarrow.string()}
+    arrays = [pyarrow.array(column, type=types[dtype])
+              for (_, dtype), column in zip(builder.schema, builder.columns)]
+    table = pyarrow.Table.from_arrays(arrays, names=[name for name, _ in builder.schema])
+    table = table.replace_schema_metadata({"meta": json.dumps(meta, default=str)})
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def encode(builder, mimetype, meta=None):
+    """Encode kolom ke format biner (msgpack typed arrays / Arrow IPC); return bytes"""
+    if mimetype == MIME_MSGPACK:
+        return _encode_msgpack(builder, meta or {})
+    if mimetype == MIME_ARROW:
+        return _encode_arrow(builder, meta or {})
+    raise ValueError(f"format kolumnar tidak didukung: {mimetype}")
+
+
+def record_encode(endpoint, mimetype, size, seconds):
+    """Catat ukuran & waktu encode per endpoint/format (untuk perbandingan format)"""
+    with encode_stats_lock:
+        entry = encode_stats.setdefault(f"{endpoint} {mimetype}", {
+            "responses": 0, "bytes": 0, "encode_sec": 0.0, "encode_max_sec": 0.0
+        })
+        entry["responses"] += 1
+        entry["bytes"] += size
+        entry["encode_sec"] += seconds
+        entry["encode_max_sec"] = max(entry["encode_max_sec"], seconds)
+
+def get_encode_stats():
+    with encode_stats_lock:
+        stats = {key: dict(entry) for key, entry in encode_stats.items()}
+    for entry in stats.values():
+        responses = entry.pop("responses")
+        encode_sec = entry.pop("encode_sec")
+        entry["responses"] = responses
+        entry["avg_bytes"] = round(entry["bytes"] / responses) if responses else 0
+        entry["avg_encode_ms"] = round(encode_sec / responses * 1000, 3) if responses else 0.0
+        entry["max_encode_ms"] = round(entry.pop("encode_max_sec") * 1000, 3)
+    return {"available": available_mimetypes(), "formats": stats}
+
+
+def timed(fn):
+    """Jalankan fn() dan kembalikan (hasil, durasi detik)"""
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
@@ -1,11 +1,20 @@
 import sqlite3
+import sys
 
 DB_PATH = "pzem.db"
+PARTITION_DIR = "pzem_partitions"
+
+# Rentang default backfill (seluruh histori)
+BACKFILL_MIN_DAY = "0000-01-01"
+BACKFILL_MAX_DAY = "9999-12-31"
 
 def migrate():
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
 
+    # Auto-vacuum incremental (hanya berlaku untuk DB baru; DB lama: enable-incremental-vacuum)
+    cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
     # 1. Tabel gedung (dengan code unik untuk MQTT topic)
     cur.execute("""
         CREATE TABLE IF NOT EXISTS buildings (
@@ -56,6 +65,9 @@ def migrate():
         )
     """)
 
+    # 5. Tabel rollup per jam + kolom tambahan daily_energy
+    create_rollup_tables(cur)
+
     # Index untuk mempercepat query per sensor & waktu
     cur.execute("""
         CREATE INDEX IF NOT EXISTS idx_sensor_time
@@ -67,6 +79,188 @@ def migrate():
     print("Migration selesai: tabel siap digunakan.")
 
 
+def create_rollup_tables(cur):
+    """
+    Buat tabel hourly_energy dan lengkapi kolom daily_energy untuk rollup
+    inkremental. Return True bila hourly_energy baru dibuat (perlu backfill).
+    """
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hourly_energy'")
+    created = cur.fetchone() is None
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS hourly_energy (
+            sensor_id INTEGER NOT NULL,
+            hour TEXT NOT NULL,          -- 'YYYY-MM-DD HH:00:00'
+            total_energy_kWh REAL NOT NULL DEFAULT 0,
+            total_cost REAL NOT NULL DEFAULT 0,
+            sum_power REAL NOT NULL DEFAULT 0,
+            avg_power REAL,
+            peak_power REAL,
+            sample_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (sensor_id, hour),
+            FOREIGN KEY (sensor_id) REFERENCES sensors(id) ON DELETE CASCADE
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS daily_energy (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sensor_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            total_energy_kWh REAL,
+            avg_power REAL,
+            peak_power REAL,
+            FOREIGN KEY (sensor_id) REFERENCES sensors(id) ON DELETE CASCADE,
+            UNIQUE(sensor_id, date)
+        )
+    """)
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(daily_energy)")}
+    for column, decl in (("total_cost", "REAL NOT NULL DEFAULT 0"),
+                         ("sum_power", "REAL NOT NULL DEFAULT 0"),
+                         ("sample_count", "INTEGER NOT NULL DEFAULT 0")):
+        if column not in columns:
+            cur.execute(f"ALTER TABLE daily_energy ADD COLUMN {column} {decl}")
+    return created
+
+
+def create_readings_partition(cur, schema):
+    """
+    Tabel readings di database partisi yang sudah di-ATTACH sebagai `schema`.
+    ts = detik epoch dari waktu lokal (dibaca sebagai UTC, sama dengan
+    strftime('%s')); WITHOUT ROWID sehingga baris tersimpan urut (sensor_id, ts)
+    langsung di B-tree primary key tanpa index terpisah.
+    """
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.readings (
+            sensor_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            voltage REAL,
+            current REAL,
+            power REAL,
+            energy REAL,
+            frequency REAL,
+            power_factor REAL,
+            cost REAL,
+            PRIMARY KEY (sensor_id, ts)
+        ) WITHOUT ROWID
+    """)
+
+
+# Ekspresi per format tabel pembacaan: (filter rentang waktu, awal jam 'YYYY-MM-DD HH:00:00')
+# 'timestamp' = sensor_readings lama (TEXT), 'ts' = readings partisi (epoch INTEGER)
+READING_TIME_SQL = {
+    "timestamp": ("timestamp >= ?1 AND timestamp < ?2", "strftime('%Y-%m-%d %H:00:00', timestamp)"),
+    "ts": ("ts >= CAST(strftime('%s', ?1) AS INTEGER) AND ts < CAST(strftime('%s', ?2) AS INTEGER)",
+           "strftime('%Y-%m-%d %H:00:00', ts - ts % 3600, 'unixepoch')")
+}
+
+
+def backfill_rollups(cur, start_day=BACKFILL_MIN_DAY, end_day=BACKFILL_MAX_DAY,
+                     sources=(("sensor_readings", "timestamp"),), sensor_ids=None):
+    """
+    Hitung ulang hourly_energy & daily_energy dari tabel pembacaan `sources`
+    [(tabel, kolom waktu 'timestamp'/'ts'), ...] (tabel utama dan/atau partisi
+    yang di-ATTACH) untuk hari [start_day, end_day) format 'YYYY-MM-DD'.
+
+    Hanya UPSERT: jam yang tidak punya data mentah lagi (sudah dibuang retensi)
+    tidak disentuh. daily_energy dihitung ulang dari hourly_energy untuk setiap
+    hari di rentang, kecuali hari yang jam-jamnya sudah dipangkas retensi hourly
+    (sampel hourly_energy hari itu lebih sedikit dari daily_energy). sensor_ids
+    membatasi rebuild ke sensor tertentu (mis. hanya sensor yang baru diimport).
+    Return jumlah baris hourly.
+    """
+    start_ts = f"{start_day} 00:00:00"
+    end_ts = f"{end_day} 00:00:00"
+    sensor_filter, sensor_args = "", ()
+    if sensor_ids is not None:
+        # parameter bernomor ?3.. karena filter diulang di setiap sumber UNION
+        sensor_filter = " AND sensor_id IN ({})".format(", ".join(f"?{i + 3}" for i in range(len(sensor_ids))))
+        sensor_args = tuple(sensor_ids)
+    readings = " UNION ALL ".join(
+        f"SELECT sensor_id, {READING_TIME_SQL[column][1]} AS hour, energy, cost, power "
+        f"FROM {table} WHERE {READING_TIME_SQL[column][0]}{sensor_filter}"
+        for table, column in sources
+    )
+    cur.execute(f"""
+        INSERT INTO hourly_energy
+            (sensor_id, hour, total_energy_kWh, total_cost, sum_power, avg_power, peak_power, sample_count)
+        SELECT sensor_id, hour,
+               COALESCE(SUM(energy), 0), COALESCE(SUM(cost), 0), COALESCE(SUM(power), 0),
+               AVG(power), MAX(power), COUNT(*)
+        FROM ({readings})
+        WHERE true
+        GROUP BY 1, 2
+        ON CONFLICT (sensor_id, hour) DO UPDATE SET
+            total_energy_kWh = excluded.total_energy_kWh,
+            total_cost = excluded.total_cost,
+            sum_power = excluded.sum_power,
+            avg_power = excluded.avg_power,
+            peak_power = excluded.peak_power,
+            sample_count = excluded.sample_count
+    """, (start_ts, end_ts, *sensor_args))
+    hourly_rows = cur.rowcount
+
+    # hari yang hourly_energy-nya lebih sedikit sampel dari daily_energy sudah
+    # dipangkas retensi hourly: angka harian lama satu-satunya yang lengkap
+    cur.execute(f"""
+        INSERT INTO daily_energy
+            (sensor_id, date, total_energy_kWh, total_cost, sum_power, avg_power, peak_power, sample_count)
+        SELECT h.sensor_id, h.date, h.energy, h.cost, h.sum_power,
+               h.sum_power / h.samples, h.peak, h.samples
+        FROM (
+            SELECT sensor_id, date(hour) AS date,
+                   SUM(total_energy_kWh) AS energy, SUM(total_cost) AS cost, SUM(sum_power) AS sum_power,
+                   MAX(peak_power) AS peak, SUM(sample_count) AS samples
+            FROM hourly_energy
+            WHERE hour >= ?1 AND hour < ?2{sensor_filter}
+            GROUP BY 1, 2
+        ) h
+        LEFT JOIN daily_energy d ON d.sensor_id = h.sensor_id AND d.date = h.date
+        WHERE d.sample_count IS NULL OR h.samples >= d.sample_count
+        ON CONFLICT (sensor_id, date) DO UPDATE SET
+            total_energy_kWh = excluded.total_energy_kWh,
+            total_cost = excluded.total_cost,
+            sum_power = excluded.sum_power,
+            avg_power = excluded.avg_power,
+            peak_power = excluded.peak_power,
+            sample_count = excluded.sample_count
+    """, (start_ts, end_ts, *sensor_args))
+    return hourly_rows
+
+
+def backfill(start_day=BACKFILL_MIN_DAY, end_day=BACKFILL_MAX_DAY):
+    # lewat backend supaya partisi bulanan ikut dibaca
+    from storage import SQLiteBackend
+    backend = SQLiteBackend(DB_PATH, PARTITION_DIR)
+    rows = backend.rebuild_rollups(start_day, end_day)
+    backend.close()
+    print(f"Backfill rollup selesai: {rows} baris hourly_energy ({start_day} s/d {end_day}).")
+
+
+def partition_legacy():
+    """
+    Pindahkan sensor_readings lama (DB utama / partisi format TEXT) ke tabel
+    readings partisi bulanan. Sama dengan migrasi online yang dijalankan
+    server di background; aman dihentikan dan diulang.
+    """
+    from storage import SQLiteBackend
+    backend = SQLiteBackend(DB_PATH, PARTITION_DIR)
+    report = backend.migrate_legacy_readings()
+    backend.close()
+    print(f"Migrasi readings selesai: {report['moved']} baris dipindah, "
+          f"{report['invalid']} baris timestamp tidak valid dibuang ({report['seconds']} detik).")
+
+
+def enable_incremental_vacuum():
+    """Aktifkan auto_vacuum=INCREMENTAL pada DB lama (butuh VACUUM penuh sekali, jalankan saat server mati)"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    conn.close()
+    print(f"auto_vacuum sekarang = {mode} (2 = INCREMENTAL).")
+
+
 def seed():
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
@@ -117,5 +311,16 @@ def seed():
 
 
 if __name__ == "__main__":
-    migrate()
-    seed()
+    # python db_migration.py                      -> migrate + seed
+    # python db_migration.py backfill [dari] [ke] -> bangun ulang rollup (hari 'YYYY-MM-DD')
+    # python db_migration.py enable-incremental-vacuum -> aktifkan incremental vacuum di DB lama
+    # python db_migration.py partition            -> pindahkan sensor_readings lama ke partisi bulanan (epoch)
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        backfill(*sys.argv[2:4])
+    elif len(sys.argv) > 1 and sys.argv[1] == "enable-incremental-vacuum":
+        enable_incremental_vacuum()
+    elif len(sys.argv) > 1 and sys.argv[1] == "partition":
+        partition_legacy()
+    else:
+        migrate()
+        seed()
@@ -0,0 +1,64 @@
+# Downsampling deret waktu (x, y) untuk chart: mengurangi jumlah titik
+# tanpa menghilangkan bentuk (puncak/lembah) deret.
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets: pilih `threshold` titik dari list (x, y)
+    terurut x. Titik pertama & terakhir selalu dipertahankan.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points[:threshold]) if threshold < 3 else list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # rata-rata bucket berikutnya sebagai titik ketiga segitiga
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = avg_y = 0.0
+        for x, y in points[avg_start:avg_end]:
+            avg_x += x
+            avg_y += y
+        span = avg_end - avg_start
+        avg_x /= span
+        avg_y /= span
+
+        # titik di bucket sekarang yang membentuk segitiga terbesar
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = points[a]
+        best_area = -1.0
+        best = range_start
+        for j in range(range_start, range_end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+def minmax(buckets):
+    """
+    Dari bucket (x, avg, min, max) hasil DB, keluarkan titik min & max setiap
+    bucket (urutan sesuai arah tren) sehingga lonjakan singkat tetap terlihat.
+    Hasil maksimal 2 titik per bucket.
+    """
+    result = []
+    previous = None
+    for x, avg, low, high in buckets:
+        if low == high:
+            result.append((x, low))
+        elif previous is not None and avg < previous:
+            result.append((x, high))
+            result.append((x, low))
+        else:
+            result.append((x, low))
+            result.append((x, high))
+        previous = avg
+    return result
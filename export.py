@@ -0,0 +1,137 @@
+import csv
+import io
+import threading
+import zlib
+
+try:
+    import pyarrow  # Parquet (opsional)
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Ekspor pembacaan mentah per chunk: setiap batch baris langsung di-encode
+# dan dikirim, sehingga memori tetap datar berapa pun panjang rentangnya.
+EXPORT_COLUMNS = ("timestamp", "building", "sensor", "sensor_id", "voltage", "current", "power",
+                  "energy", "frequency", "power_factor", "cost")
+EXPORT_FORMATS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+export_stats = {}
+export_stats_lock = threading.Lock()
+
+
+def available_formats():
+    return [fmt for fmt in EXPORT_FORMATS if fmt != "parquet" or pyarrow is not None]
+
+
+def csv_chunks(batches, format_time):
+    """Header lalu satu blok bytes CSV per batch baris EXPORT_COLUMNS"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows((format_time(row[0]), *row[1:]) for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink:
+    """File tulis minimal untuk ParquetWriter: tampung bytes, posisi terus bertambah"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def _parquet_schema(first_timestamp):
+    # naive (SQLite, waktu lokal) vs timestamptz (TimescaleDB)
+    if first_timestamp is not None and first_timestamp.tzinfo is not None:
+        ts_type = pyarrow.timestamp("us", tz="UTC")
+    else:
+        ts_type = pyarrow.timestamp("s")
+    return pyarrow.schema([("timestamp", ts_type), ("building", pyarrow.string()), ("sensor", pyarrow.string()),
+                           ("sensor_id", pyarrow.int64())] +
+                          [(name, pyarrow.float64()) for name in EXPORT_COLUMNS[4:]])
+
+
+def parquet_chunks(batches, compression="zstd"):
+    """Satu row group per batch; bytes dikirim setelah tiap row group, footer di akhir"""
+    sink = _ChunkSink()
+    writer = None
+    for batch in batches:
+        if writer is None:
+            schema = _parquet_schema(batch[0][0] if batch else None)
+            writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode="w"), schema,
+                                                   compression=compression)
+        columns = list(zip(*batch)) if batch else [[] for _ in EXPORT_COLUMNS]
+        writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+        data = sink.drain()
+        if data:
+            yield data
+    if writer is None:
+        schema = _parquet_schema(None)
+        writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode="w"), schema, compression=compression)
+    writer.close()
+    yield sink.drain()
+
+
+def gzip_chunks(chunks, level=6):
+    """Kompres stream chunk sebagai gzip tanpa menampung seluruh isi"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _stats_entry(fmt):
+    return export_stats.setdefault(fmt, {
+        "exports": 0, "aborted": 0, "rejected": 0, "rows": 0, "bytes": 0, "seconds": 0.0
+    })
+
+def record_export(fmt, rows, size, seconds, completed):
+    with export_stats_lock:
+        entry = _stats_entry(fmt)
+        entry["exports"] += 1
+        if not completed:
+            entry["aborted"] += 1
+        entry["rows"] += rows
+        entry["bytes"] += size
+        entry["seconds"] += seconds
+
+def record_rejected(fmt):
+    """Ekspor ditolak (503) karena semua slot koneksi ekspor terpakai"""
+    with export_stats_lock:
+        _stats_entry(fmt)["rejected"] += 1
+
+def get_export_stats():
+    with export_stats_lock:
+        stats = {fmt: dict(entry) for fmt, entry in export_stats.items()}
+    for entry in stats.values():
+        entry["rows_per_sec"] = round(entry["rows"] / entry["seconds"]) if entry["seconds"] else 0
+        entry["seconds"] = round(entry["seconds"], 3)
+    return {"available": available_formats(), "formats": stats}
@@ -0,0 +1,240 @@
+import argparse
+import csv
+import gzip
+import sys
+import time
+from datetime import datetime, timedelta
+
+from storage import create_backend
+from topology import build_topology
+
+# Import histori log PZEM (CSV dari gateway atau hasil /api/export) ke storage
+# aktif. Baris di-batch besar ke StorageBackend.import_history (SQLite: executemany
+# dalam satu transaksi per batch, TimescaleDB: COPY ke staging lalu upsert),
+# duplikat (sensor_id, timestamp) ditimpa, lalu rollup dibangun ulang sekali
+# untuk sensor & rentang hari yang terkena (TimescaleDB: hari di dekat batas
+# retensi raw langsung di-refresh per batch, hari lama yang sudah punya rollup
+# harian ditolak). Energi/biaya yang tidak ada di CSV
+# dihitung dengan interval & tarif profil deployment backend (server.BILLING_PROFILES).
+#
+#   python import_readings.py [--backend sqlite|timescale] [--batch N] [--interval DETIK]
+#                             [--tariff RP_PER_KWH] [--ppj FRAKSI] file.csv[.gz] ...
+
+IMPORT_BATCH_ROWS = 50000
+PROGRESS_EVERY_SEC = 5.0
+
+# nama kolom CSV (huruf kecil) -> kolom import; nama payload gateway & nama ekspor
+COLUMN_ALIASES = {
+    "timestamp": "timestamp", "tanggal": "timestamp", "waktu": "timestamp", "time": "timestamp",
+    "sensor_id": "sensor_id", "topic": "topic",
+    "building": "building", "gedung": "building", "building_code": "building",
+    "sensor": "sensor", "sensor_name": "sensor",
+    "voltage": "voltage", "tegangan": "voltage",
+    "current": "current", "arus": "current",
+    "power": "power", "daya": "power",
+    "energy": "energy", "energi": "energy",
+    "frequency": "frequency", "frekuensi": "frequency",
+    "power_factor": "power_factor", "pf": "power_factor",
+    "cost": "cost", "biaya": "cost"
+}
+REQUIRED_COLUMNS = ("timestamp", "voltage", "current", "power")
+
+
+class SensorResolver:
+    """Petakan identitas sensor di CSV (sensor_id, topic, atau gedung + sensor) ke sensor_id"""
+
+    def __init__(self, topology):
+        self.ids = set(topology.by_sensor_id)
+        self.routes = dict(topology.routes)
+        self.names = {}
+        for building in topology.buildings:
+            for sensor in building.sensors:
+                for key in (building.code, building.name):
+                    self.names[(key.lower(), sensor.sensor_name.lower())] = sensor.sensor_id
+
+    def resolve(self, sensor_id=None, topic=None, building=None, sensor=None):
+        if sensor_id:
+            sensor_id = int(sensor_id)
+            return sensor_id if sensor_id in self.ids else None
+        if topic:
+            return self.routes.get(topic.strip())
+        if building and sensor:
+            return self.names.get((building.strip().lower(), sensor.strip().lower()))
+        return None
+
+
+def open_log(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", newline="")
+    return open(path, newline="")
+
+def time_normalizer(backend):
+    """SQLite menyimpan waktu lokal naive, TimescaleDB timestamptz (naive dianggap waktu lokal)"""
+    if backend.now().tzinfo is None:
+        return lambda dt: dt.astimezone().replace(tzinfo=None) if dt.tzinfo else dt
+    return lambda dt: dt if dt.tzinfo else dt.astimezone()
+
+def billing_profile(backend, interval=None, tariff=None, ppj=None):
+    """Profil tarif backend (server.BILLING_PROFILES) dengan override dari argumen CLI"""
+    import server  # impor berat (Flask, MQTT) hanya untuk CLI, bukan import_files
+    profile = dict(server.BILLING_PROFILES[backend])
+    for key, value in (("interval_sec", interval), ("tarif_per_kwh", tariff), ("ppj", ppj)):
+        if value is not None:
+            profile[key] = value
+    return profile
+
+def read_batches(path, resolver, normalize, report, billing, batch_rows=IMPORT_BATCH_ROWS):
+    """
+    Generator batch baris READING_COLUMNS dari satu file log. Baris rusak atau
+    sensor yang tidak dikenal dilewati dan dicatat di report.
+    """
+    tariff = billing["tarif_per_kwh"] * (1 + billing["ppj"])
+    interval = billing["interval_sec"]
+    with open_log(path) as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        index = {}
+        for position, name in enumerate(header):
+            column = COLUMN_ALIASES.get(name.strip().lower())
+            if column and column not in index:
+                index[column] = position
+        missing = [column for column in REQUIRED_COLUMNS if column not in index]
+        if not any(k in index for k in ("sensor_id", "topic")) and not ("building" in index and "sensor" in index):
+            missing.append("sensor_id|topic|building+sensor")
+        if missing:
+            raise ValueError(f"{path}: kolom wajib tidak ada: {', '.join(missing)}")
+
+        identity = [(key, index[key]) for key in ("sensor_id", "topic", "building", "sensor") if key in index]
+
+        def get(row, column):
+            """Nilai kolom opsional; None bila kolom tidak ada atau kosong"""
+            return row[index[column]] if column in index and row[index[column]] != "" else None
+
+        batch = []
+        for line, row in enumerate(reader, start=2):
+            try:
+                sensor_id = resolver.resolve(**{key: row[position] for key, position in identity})
+                if sensor_id is None:
+                    unknown = " ".join(row[position] for _, position in identity)
+                    report["unknown"][unknown] = report["unknown"].get(unknown, 0) + 1
+                    continue
+                power = float(row[index["power"]])
+                energy = get(row, "energy")
+                # log mentah gateway tanpa energi/biaya: hitung seperti jalur MQTT
+                energy = float(energy) if energy is not None else power * interval / 3.6e6
+                cost = get(row, "cost")
+                cost = float(cost) if cost is not None else energy * tariff
+                frequency, power_factor = get(row, "frequency"), get(row, "power_factor")
+                batch.append((
+                    sensor_id,
+                    normalize(datetime.fromisoformat(row[index["timestamp"]].strip())),
+                    float(row[index["voltage"]]),
+                    float(row[index["current"]]),
+                    power,
+                    energy,
+                    float(frequency) if frequency is not None else None,
+                    cost,
+                    float(power_factor) if power_factor is not None else None
+                ))
+            except (ValueError, IndexError) as e:
+                report["invalid"] += 1
+                if report["invalid"] <= 10:
+                    print(f"  {path}:{line} dilewati: {e}")
+                continue
+            if len(batch) >= batch_rows:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def import_files(backend, paths, billing, batch_rows=IMPORT_BATCH_ROWS):
+    """Import semua file lalu hitung ulang rollup sensor & hari yang terkena; return dict laporan"""
+    resolver = SensorResolver(build_topology(backend.fetch_topology()))
+    normalize = time_normalizer(backend)
+    report = {"rows": 0, "invalid": 0, "rejected": 0, "unknown": {}, "first": None, "last": None, "sensors": set()}
+    imported_days = set()
+    started = last_progress = time.monotonic()
+    load_sec = 0.0
+    for path in paths:
+        print(f"import {path}")
+        for batch in read_batches(path, resolver, normalize, report, billing, batch_rows):
+            report["sensors"].update(row[0] for row in batch)
+            first = min(row[1] for row in batch)
+            last = max(row[1] for row in batch)
+            report["first"] = first if report["first"] is None else min(report["first"], first)
+            report["last"] = last if report["last"] is None else max(report["last"], last)
+            load_started = time.monotonic()
+            written, rejected = backend.import_history(batch, imported_days)
+            report["rows"] += written
+            report["rejected"] += rejected
+            load_sec += time.monotonic() - load_started
+            if time.monotonic() - last_progress >= PROGRESS_EVERY_SEC:
+                last_progress = time.monotonic()
+                print(f"  {report['rows']} baris, {report['rows'] / (last_progress - started):.0f} baris/detik")
+    import_sec = time.monotonic() - started
+
+    rollup_sec = 0.0
+    if report["rows"]:
+        rollup_started = time.monotonic()
+        start_day = report["first"].strftime("%Y-%m-%d")
+        end_day = (report["last"] + timedelta(days=1)).strftime("%Y-%m-%d")
+        print(f"rebuild rollup {start_day} .. {end_day} ({len(report['sensors'])} sensor)")
+        backend.rebuild_rollups(start_day, end_day, sorted(report["sensors"]))
+        rollup_sec = time.monotonic() - rollup_started
+
+    report.update({
+        "import_sec": round(import_sec, 3),
+        "load_sec": round(load_sec, 3),
+        "rollup_sec": round(rollup_sec, 3),
+        "rows_per_sec": round(report["rows"] / import_sec) if import_sec else 0
+    })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import histori log PZEM (CSV) ke storage")
+    parser.add_argument("files", nargs="+", help="file CSV (boleh .gz)")
+    parser.add_argument("--backend", choices=("sqlite", "timescale"), help="default: STORAGE_CONFIG / PZEM_BACKEND")
+    parser.add_argument("--batch", type=int, default=IMPORT_BATCH_ROWS, help="baris per transaksi")
+    parser.add_argument("--interval", type=float, help="detik per sampel bila CSV tanpa kolom energi")
+    parser.add_argument("--tariff", type=float, help="tarif Rp/kWh bila CSV tanpa kolom biaya")
+    parser.add_argument("--ppj", type=float, help="PPJ (fraksi, mis. 0.10) bila CSV tanpa kolom biaya")
+    args = parser.parse_args(argv)
+
+    import server
+    config = dict(server.STORAGE_CONFIG)
+    if args.backend:
+        config["backend"] = args.backend
+    billing = billing_profile(config["backend"], args.interval, args.tariff, args.ppj)
+    print(f"backend {config['backend']}: interval {billing['interval_sec']} s, "
+          f"tarif {billing['tarif_per_kwh']}/kWh, PPJ {billing['ppj']:.0%}")
+    backend = create_backend(config)
+    try:
+        report = import_files(backend, args.files, billing, args.batch)
+    finally:
+        backend.close()
+
+    print(f"{report['rows']} baris diimport dalam {report['import_sec']} detik "
+          f"({report['rows_per_sec']} baris/detik, bulk load {report['load_sec']} detik), "
+          f"rollup {report['rollup_sec']} detik")
+    if report["first"] is not None:
+        print(f"rentang {report['first']} .. {report['last']}")
+    if report["invalid"]:
+        print(f"{report['invalid']} baris rusak dilewati")
+    if report["rejected"]:
+        # TimescaleDB: hari di luar retensi raw yang sudah punya daily_energy
+        print(f"{report['rejected']} baris dilewati: hari sebelum batas retensi raw yang sudah punya rollup harian")
+    if report["unknown"]:
+        skipped = sum(report["unknown"].values())
+        print(f"{skipped} baris dengan sensor tidak dikenal dilewati:")
+        for key, count in sorted(report["unknown"].items(), key=lambda item: -item[1])[:10]:
+            print(f"  {key}: {count}")
+    if report["rows"]:
+        # server yang sedang berjalan menyimpan total periode di memori
+        print("restart server agar total periode di memori memuat data import")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import json
+import queue
+import threading
+import time
+from pzem_logging import get_logger
+
+log = get_logger("stream")
+
+
+class LiveSubscriber:
+    """Satu koneksi stream; frame masuk lewat antrian kecil milik koneksi itu sendiri"""
+
+    def __init__(self, buildings=None, queue_size=16):
+        self.buildings = frozenset(buildings) if buildings else None   # filter kode gedung
+        self.queue = queue.Queue(queue_size)
+        self.resync = False          # True bila ada frame terbuang -> kirim snapshot penuh
+        self.dropped = 0
+
+    def put(self, data):
+        try:
+            self.queue.put_nowait(data)
+        except queue.Full:
+            # klien lambat: buang backlog, klien akan menerima snapshot penuh
+            self.resync = True
+            self.dropped += 1
+
+    def drain(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+class LiveBroadcaster:
+    """
+    Fan-out update sensor ke semua subscriber stream. handle_message hanya
+    menandai sensor yang berubah; thread broadcaster menggabungkan perubahan
+    menjadi paling banyak `fps` frame per detik, membangun frame sekali lewat
+    build_frame(sensor_ids) -> {nama_gedung: {"code": ..., ...}}, lalu
+    men-serialize sekali per filter gedung yang berbeda.
+    """
+
+    def __init__(self, build_frame, fps=2.0, queue_size=16):
+        self.build_frame = build_frame
+        self.interval = 1.0 / fps
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.dirty = set()
+        self.subscribers = set()
+        self.stats = {"frames": 0, "events": 0}
+        self._thread = None
+
+    # --------------------- producer ----------------------
+    def mark_dirty(self, sensor_id):
+        with self.lock:
+            self.dirty.add(sensor_id)
+
+    # -------------------- subscriber ---------------------
+    def subscribe(self, buildings=None):
+        subscriber = LiveSubscriber(buildings, self.queue_size)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    @staticmethod
+    def encode(event, frame, buildings=None):
+        """Serialize frame menjadi satu event SSE (None bila filter membuatnya kosong)"""
+        if buildings is not None:
+            frame = {name: payload for name, payload in frame.items() if payload["code"] in buildings}
+            if not frame:
+                return None
+        data = json.dumps({"type": event, "buildings": frame}, separators=(",", ":"), default=str)
+        return f"event: {event}\ndata: {data}\n\n"
+
+    # --------------------- broadcaster -------------------
+    def publish(self):
+        """Bangun satu frame dari sensor yang berubah dan kirim ke semua subscriber"""
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            subscribers = list(self.subscribers)
+        if not dirty or not subscribers:
+            return 0
+
+        frame = self.build_frame(dirty)
+        encoded = {}
+        for subscriber in subscribers:
+            key = subscriber.buildings
+            if key not in encoded:
+                encoded[key] = self.encode("update", frame, key)
+            if encoded[key] is not None:
+                subscriber.put(encoded[key])
+                self.stats["events"] += 1
+        self.stats["frames"] += 1
+        return len(subscribers)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.publish()
+            except Exception as e:
+                log.error("publish frame stream gagal: %s", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="live-stream", daemon=True)
+            self._thread.start()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            subscribers = list(self.subscribers)
+            stats["pending_sensors"] = len(self.dirty)
+        stats["subscribers"] = len(subscribers)
+        stats["dropped"] = sum(s.dropped for s in subscribers)
+        stats["fps"] = round(1.0 / self.interval, 2)
+        return stats
@@ -0,0 +1,114 @@
+import os
+import re
+import threading
+from datetime import datetime
+
+# Partisi waktu pembacaan sensor untuk SQLite: satu file database per bulan
+# (readings_YYYY_MM.db) yang di-ATTACH sesuai kebutuhan dengan nama schema
+# p_YYYY_MM. Index tiap file kecil, bulan lama dibuang/diarsip dengan
+# menghapus/memindah file tanpa DELETE + VACUUM.
+PARTITION_FILE = re.compile(r"^readings_(\d{4})_(\d{2})\.db$")
+SCHEMA_PREFIX = "p_"
+# bulan 'YYYY-MM' yang valid dari kolom timestamp TEXT lama (GLOB SQLite)
+MONTH_GLOB = "[0-9][0-9][0-9][0-9]-[01][0-9]"
+
+def month_key(ts):
+    """Kunci partisi 'YYYY_MM' dari datetime atau string 'YYYY-MM-DD HH:MM:SS'"""
+    if isinstance(ts, str):
+        return ts[:4] + "_" + ts[5:7]
+    return f"{ts.year:04d}_{ts.month:02d}"
+
+def month_start(key):
+    return datetime(int(key[:4]), int(key[5:7]), 1)
+
+def next_month(key):
+    year, month = int(key[:4]), int(key[5:7])
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{year:04d}_{month:02d}"
+
+def month_end(key):
+    """Awal bulan berikutnya (batas eksklusif partisi)"""
+    return month_start(next_month(key))
+
+def schema_name(key):
+    return SCHEMA_PREFIX + key
+
+
+class MonthPartitions:
+    """
+    Registry file partisi bulanan dalam satu direktori. Planner hanya
+    memilih partisi yang benar-benar ada dan overlap dengan rentang query.
+    """
+
+    def __init__(self, directory, archive_dir=None):
+        self.directory = directory
+        self.archive_dir = archive_dir     # None -> partisi kadaluarsa dihapus
+        self.lock = threading.Lock()
+        self.months = {}                   # 'YYYY_MM' -> path file
+        os.makedirs(directory, exist_ok=True)
+        self.scan()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"readings_{key}.db")
+
+    def scan(self):
+        months = {}
+        for filename in os.listdir(self.directory):
+            match = PARTITION_FILE.match(filename)
+            if match:
+                key = f"{match.group(1)}_{match.group(2)}"
+                months[key] = self.path(key)
+        with self.lock:
+            self.months = months
+        return sorted(months)
+
+    def keys(self):
+        with self.lock:
+            return sorted(self.months)
+
+    def exists(self, key):
+        with self.lock:
+            return key in self.months
+
+    def add(self, key):
+        with self.lock:
+            self.months[key] = self.path(key)
+
+    def overlapping(self, start, end):
+        """Kunci partisi yang ada dan overlap [start, end], urut waktu"""
+        first, last = month_key(start), month_key(end)
+        with self.lock:
+            return [key for key in sorted(self.months) if first <= key <= last]
+
+    def expired(self, cutoff):
+        """Partisi yang seluruh isinya lebih tua dari cutoff (datetime)"""
+        with self.lock:
+            return [key for key in sorted(self.months) if month_end(key) <= cutoff]
+
+    def remove(self, key):
+        """
+        Keluarkan partisi dari registry lalu hapus atau pindahkan filenya ke
+        archive_dir. Harus sudah di-DETACH dari writer; reader yang masih
+        meng-attach akan melepasnya sendiri karena tidak ada di registry.
+        """
+        with self.lock:
+            path = self.months.pop(key, None)
+        if path is None:
+            return None
+        if self.archive_dir:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            target = os.path.join(self.archive_dir, os.path.basename(path))
+            os.replace(path, target)
+        else:
+            target = None
+            os.remove(path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        return target
+
+    def total_bytes(self):
+        with self.lock:
+            paths = list(self.months.values())
+        return sum(os.path.getsize(p + suffix) for p in paths for suffix in ("", "-wal")
+                   if os.path.exists(p + suffix))
@@ -0,0 +1,157 @@
+import threading
+from collections import deque
+
+BUCKET_SEC = 3600
+# Jendela rolling (hari) yang dipakai dashboard: 'minggu' = 7, 'bulan' = 30
+ROLLING_WINDOWS = (7, 30)
+
+
+class PeriodTotals:
+    """
+    Akumulator energi/biaya per sensor & per gedung untuk bulan berjalan dan
+    jendela rolling 7/30 hari. Di-seed dari DB saat startup, ditambah setiap
+    baris flush masuk DB, dan di-roll saat batas periode lewat.
+
+    Jendela rolling memakai bucket per jam, jadi batas bawahnya dibulatkan
+    ke awal jam (selisih maksimal satu jam dibanding query detik-per-detik).
+    """
+
+    def __init__(self, windows=ROLLING_WINDOWS):
+        self.lock = threading.Lock()
+        self.ready = False
+        self.sensor_building = {}          # sensor_id -> building_name
+        self.month_key = None
+        self.month = {}                    # sensor_id -> [energy, cost]
+        self.month_buildings = {}          # building_name -> [energy, cost]
+        self.windows = {}
+        for days in windows:
+            self.windows[days] = {
+                "seconds": days * 86400,
+                "buckets": deque(),        # (bucket_start, {sensor_id: [energy, cost]})
+                "sensors": {},
+                "buildings": {}
+            }
+
+    # ------------------------ internal ------------------------
+    @staticmethod
+    def _add(totals, key, energy, cost):
+        entry = totals.get(key)
+        if entry is None:
+            totals[key] = [energy, cost]
+        else:
+            entry[0] += energy
+            entry[1] += cost
+
+    def _roll(self, now):
+        """Reset bulan saat ganti bulan dan keluarkan bucket yang lewat dari jendela rolling"""
+        month_key = (now.year, now.month)
+        if month_key != self.month_key:
+            self.month_key = month_key
+            self.month = {}
+            self.month_buildings = {}
+
+        epoch = now.timestamp()
+        for window in self.windows.values():
+            cutoff = epoch - window["seconds"]
+            buckets = window["buckets"]
+            while buckets and buckets[0][0] + BUCKET_SEC <= cutoff:
+                _, expired = buckets.popleft()
+                for sensor_id, (energy, cost) in expired.items():
+                    self._add(window["sensors"], sensor_id, -energy, -cost)
+                    building = self.sensor_building.get(sensor_id)
+                    if building is not None:
+                        self._add(window["buildings"], building, -energy, -cost)
+
+    def _add_reading(self, sensor_id, ts, energy, cost, now, include_month=True):
+        building = self.sensor_building.get(sensor_id)
+        if include_month and (ts.year, ts.month) == self.month_key:
+            self._add(self.month, sensor_id, energy, cost)
+            if building is not None:
+                self._add(self.month_buildings, building, energy, cost)
+
+        epoch = ts.timestamp()
+        bucket_start = epoch - epoch % BUCKET_SEC
+        now_epoch = now.timestamp()
+        for window in self.windows.values():
+            if epoch < now_epoch - window["seconds"]:
+                continue
+            # biasanya bucket terbaru; baris lama (seed/replay) dicari dari belakang
+            buckets = window["buckets"]
+            idx = len(buckets)
+            while idx > 0 and buckets[idx - 1][0] > bucket_start:
+                idx -= 1
+            if idx > 0 and buckets[idx - 1][0] == bucket_start:
+                bucket = buckets[idx - 1][1]
+            else:
+                bucket = {}
+                buckets.insert(idx, (bucket_start, bucket))
+            self._add(bucket, sensor_id, energy, cost)
+            self._add(window["sensors"], sensor_id, energy, cost)
+            if building is not None:
+                self._add(window["buildings"], building, energy, cost)
+
+    def _rebuild_buildings(self):
+        self.month_buildings = {}
+        for sensor_id, (energy, cost) in self.month.items():
+            building = self.sensor_building.get(sensor_id)
+            if building is not None:
+                self._add(self.month_buildings, building, energy, cost)
+        for window in self.windows.values():
+            window["buildings"] = {}
+            for sensor_id, (energy, cost) in window["sensors"].items():
+                building = self.sensor_building.get(sensor_id)
+                if building is not None:
+                    self._add(window["buildings"], building, energy, cost)
+
+    # -------------------------- API ---------------------------
+    def set_topology(self, sensor_building):
+        """Perbarui mapping sensor_id -> nama gedung (dipanggil saat routing table berubah)"""
+        with self.lock:
+            self.sensor_building = dict(sensor_building)
+            self._rebuild_buildings()
+
+    def seed(self, now, month_totals, hourly_rows):
+        """
+        Isi ulang dari DB: month_totals {sensor_id: (energy, cost)} sejak awal bulan,
+        hourly_rows [(sensor_id, bucket_start datetime, energy, cost)] jendela terpanjang.
+        """
+        with self.lock:
+            self.month_key = (now.year, now.month)
+            self.month = {sid: [e, c] for sid, (e, c) in month_totals.items()}
+            for window in self.windows.values():
+                window["buckets"].clear()
+                window["sensors"] = {}
+            for sensor_id, bucket_ts, energy, cost in sorted(hourly_rows, key=lambda r: r[1]):
+                self._add_reading(sensor_id, bucket_ts, energy, cost, now, include_month=False)
+            self._rebuild_buildings()
+            self._roll(now)
+            self.ready = True
+
+    def add_rows(self, rows, now):
+        """Tambahkan baris sensor_readings (urut READING_COLUMNS) yang baru masuk DB"""
+        with self.lock:
+            self._roll(now)
+            for row in rows:
+                self._add_reading(row[0], row[1], row[5], row[7], now)
+
+    def sensors(self, period, now):
+        """Snapshot {sensor_id: (energy, cost)} untuk 'month' atau jumlah hari jendela rolling"""
+        with self.lock:
+            self._roll(now)
+            totals = self.month if period == "month" else self.windows[period]["sensors"]
+            return {k: (v[0], v[1]) for k, v in totals.items()}
+
+    def buildings(self, period, now):
+        """Snapshot {building_name: (energy, cost)}"""
+        with self.lock:
+            self._roll(now)
+            totals = self.month_buildings if period == "month" else self.windows[period]["buildings"]
+            return {k: (v[0], v[1]) for k, v in totals.items()}
+
+    def overall(self, period, now):
+        """Total (energy, cost) semua sensor"""
+        energy = cost = 0.0
+        for e, c in self.sensors(period, now).values():
+            energy += e
+            cost += c
+        return energy, cost
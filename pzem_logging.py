@@ -0,0 +1,61 @@
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# Format key=value supaya mudah di-grep / diparse dari journald
+LOG_FORMAT = "%(asctime)s level=%(levelname)s logger=%(name)s %(message)s"
+
+_listener = None
+
+def setup_logging(level: str = "INFO", trace: bool = False):
+    """
+    Pasang logging asinkron: logger 'pzem' hanya memasukkan record ke antrian,
+    penulisan ke stdout dikerjakan thread QueueListener di background.
+    trace=True menurunkan level ke DEBUG dan mematikan sampling log ingest.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+
+    logger = logging.getLogger("pzem")
+    logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(logging.DEBUG if trace else level)
+    logger.propagate = False
+    _listener.start()
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def get_logger(name: str):
+    return logging.getLogger(f"pzem.{name}")
+
+
+class RateLimiter:
+    """Izinkan maksimal satu log per `interval` detik untuk setiap key"""
+
+    def __init__(self, interval: float = 60.0):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self._last = {}
+        self._suppressed = {}
+
+    def allow(self, key):
+        """Return jumlah log yang ditahan sejak log terakhir untuk key ini, atau None bila harus ditahan"""
+        now = time.monotonic()
+        with self.lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return None
+            self._last[key] = now
+            return self._suppressed.pop(key, 0)
@@ -0,0 +1,81 @@
+import json
+import math
+import threading
+from collections import namedtuple
+from pzem_logging import get_logger
+
+try:
+    import orjson  # backend JSON cepat (opsional)
+except ImportError:
+    orjson = None
+
+# --------------------- RECORD ------------------------
+NUMERIC_FIELDS = ('tegangan', 'arus', 'daya', 'energi', 'frekuensi', 'pf', 'biaya')
+READING_FIELDS = NUMERIC_FIELDS + ('tanggal',)
+
+# Record ringkas (tuple ber-slot) hasil validasi; semua field numerik sudah float
+PzemReading = namedtuple("PzemReading", READING_FIELDS)
+EMPTY_READING = PzemReading(0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, None)
+
+log = get_logger("payload")
+
+JSON_BACKEND = "orjson" if orjson else "json"
+_loads = orjson.loads if orjson else json.loads
+
+# ---------------------- STATS ------------------------
+decode_stats = {"decoded": 0, "invalid_json": 0, "not_object": 0, "bad_field": 0}
+decode_stats_lock = threading.Lock()
+
+def _reject(reason: str, detail):
+    with decode_stats_lock:
+        decode_stats[reason] += 1
+        rejected = decode_stats[reason]
+    if rejected % 100 == 1:
+        log.warning("payload ditolak reason=%s total=%d detail=%s", reason, rejected, detail)
+    return None
+
+def _to_float(value):
+    """Konversi satu nilai field; None/absen -> 0.0, selain angka valid -> ValueError"""
+    if value is None:
+        return 0.0
+    if type(value) is float:
+        result = value
+    elif type(value) is bool:
+        raise ValueError("boolean bukan angka")
+    else:
+        result = float(value)
+    if not math.isfinite(result):
+        raise ValueError("nilai tidak finite")
+    return result
+
+# --------------------- DECODER -----------------------
+def decode_payload(payload):
+    """
+    Decode payload MQTT (bytes/str JSON) menjadi PzemReading.
+    Validasi hanya dilakukan di sini; return None (dan hitung counter) bila ditolak.
+    """
+    try:
+        obj = _loads(payload)
+    except (ValueError, TypeError) as e:
+        return _reject("invalid_json", e)
+
+    if not isinstance(obj, dict):
+        return _reject("not_object", type(obj).__name__)
+
+    try:
+        values = [_to_float(obj.get(k)) for k in NUMERIC_FIELDS]
+    except (ValueError, TypeError) as e:
+        return _reject("bad_field", e)
+
+    tanggal = obj.get('tanggal')
+    values.append(str(tanggal) if tanggal is not None else None)
+
+    with decode_stats_lock:
+        decode_stats["decoded"] += 1
+    return PzemReading._make(values)
+
+def get_decode_stats():
+    with decode_stats_lock:
+        stats = dict(decode_stats)
+    stats["backend"] = JSON_BACKEND
+    return stats
@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Cache LRU bersama untuk response JSON dashboard. Setiap entry menyimpan
+    epoch data saat dihitung; entry dengan epoch lama dianggap basi, jadi
+    menaikkan epoch (setelah data baru masuk DB) meng-invalidasi semuanya
+    sekaligus tanpa perlu menghapus satu per satu.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()       # key -> (epoch, value)
+        self.key_locks = {}                # key -> Lock, supaya satu key dihitung sekali per epoch
+        self.epoch = 0
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def bump_epoch(self):
+        """Tandai semua entry basi (dipanggil setiap ada data baru di DB)"""
+        with self.lock:
+            self.epoch += 1
+            return self.epoch
+
+    def _lookup(self, key, epoch):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != epoch:
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def get_or_compute(self, key, compute):
+        """Ambil value untuk key pada epoch sekarang; bila tidak ada, hitung sekali lewat compute()"""
+        with self.lock:
+            epoch = self.epoch
+            value = self._lookup(key, epoch)
+            if value is not None:
+                self.stats["hits"] += 1
+                return value
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # request lain dengan key sama mungkin sudah menghitungnya selagi menunggu
+            with self.lock:
+                value = self._lookup(key, epoch)
+                if value is not None:
+                    self.stats["hits"] += 1
+                    return value
+                self.stats["misses"] += 1
+                if key in self.entries:
+                    self.stats["stale"] += 1
+
+            try:
+                value = compute()
+            finally:
+                if value is None:
+                    # tidak disimpan (non-200 / error): jangan tinggalkan lock per key
+                    with self.lock:
+                        if key not in self.entries:
+                            self.key_locks.pop(key, None)
+            if value is None:
+                return None
+
+            with self.lock:
+                self.entries[key] = (epoch, value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    old_key, _ = self.entries.popitem(last=False)
+                    self.key_locks.pop(old_key, None)
+                    self.stats["evictions"] += 1
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.key_locks.clear()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self.entries)
+            stats["key_locks"] = len(self.key_locks)
+            stats["max_entries"] = self.max_entries
+            stats["epoch"] = self.epoch
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
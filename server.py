@@ -0,0 +1,1253 @@
+# server.py - MQTT ingest + dashboard API PZEM; storage engine dipilih dari config
+import os
+import math
+import functools
+import logging
+import threading
+import time
+import queue
+import zlib
+from flask import Flask, jsonify, request, render_template, Response, stream_with_context
+from datetime import datetime, timedelta
+import paho.mqtt.client as mqtt
+from agg_buffer import AggregationBuffer
+from pzem_payload import decode_payload, get_decode_stats, EMPTY_READING, NUMERIC_FIELDS, PzemReading
+from storage import create_backend, DEFAULT_BUILDINGS, SERIES_METRICS
+from spool import WriteAheadSpool
+from pzem_logging import setup_logging, get_logger, RateLimiter
+from period_totals import PeriodTotals, ROLLING_WINDOWS
+from response_cache import ResponseCache
+from topology import build_topology, EMPTY_TOPOLOGY
+from live_stream import LiveBroadcaster
+import columnar
+from columnar import ColumnBuilder, MIME_JSON
+from downsample import lttb, minmax
+import export
+from export import EXPORT_FORMATS
+
+# ----------------------- CONFIG -----------------------
+app = Flask(__name__)
+
+BROKER = "10.1.1.55"
+PORT = 1883
+TOPIC_PATTERN = "sensor/#"  # semua sensor
+TOPIC_PREDICT = "predict/pub"
+TOPIC_PREDICT_RESULT = "predict/result"
+
+# Storage backend: "sqlite" (pzem.db) atau "timescale" (TimescaleDB/PostgreSQL)
+STORAGE_CONFIG = {
+    "backend": os.environ.get("PZEM_BACKEND", "sqlite"),
+    "sqlite_path": "pzem.db",
+    # pembacaan mentah SQLite: satu file per bulan; partisi kadaluarsa dihapus,
+    # atau dipindah ke PZEM_SQLITE_ARCHIVE_DIR bila diset
+    "sqlite_partition_dir": os.environ.get("PZEM_SQLITE_PARTITION_DIR", "pzem_partitions"),
+    "sqlite_archive_dir": os.environ.get("PZEM_SQLITE_ARCHIVE_DIR"),
+    "db_config": {
+        "dbname": "sensor_data",
+        "user": "postgres",
+        "password": "nadila",
+        "host": "localhost",
+        "port": 5432
+    },
+    "pool_minconn": 1,
+    "pool_maxconn": 10,
+    # koneksi ekspor TimescaleDB (di luar pool) yang boleh terbuka sekaligus
+    "export_maxconn": int(os.environ.get("PZEM_EXPORT_MAXCONN", "2"))
+}
+storage = None
+
+# Spool write-ahead: hasil flush ditulis ke disk dulu sebelum ke DB
+SPOOL_DIR = "spool"
+SPOOL_REPLAY_BATCH_ROWS = 5000
+SPOOL_RETRY_SEC = 10
+spool = None
+
+# Retensi: raw N hari, rollup per jam M bulan, harian selamanya.
+# TimescaleDB memakai policy (timescale_migration); SQLite memakai job background di bawah.
+RETENTION_CONFIG = {
+    "raw_days": int(os.environ.get("PZEM_RAW_RETENTION_DAYS", 90)),
+    "hourly_months": int(os.environ.get("PZEM_HOURLY_RETENTION_MONTHS", 12)),
+    "interval_sec": 6 * 3600
+}
+retention_stats = {"runs": 0, "errors": 0, "deleted_raw": 0, "deleted_hourly": 0,
+                   "reclaimed_bytes": 0, "last": None}
+retention_stats_lock = threading.Lock()
+
+# Logging: PZEM_LOG_TRACE=1 untuk trace per pesan (tanpa sampling) saat debugging
+LOG_LEVEL = os.environ.get("PZEM_LOG_LEVEL", "INFO")
+LOG_TRACE = os.environ.get("PZEM_LOG_TRACE", "0") == "1"
+LOG_SAMPLE_SEC = 60       # log ingest berulang: maksimal sekali per sensor/topic per interval
+LOG_SUMMARY_SEC = 60      # interval baris ringkasan ingest
+
+log = get_logger("server")
+ingest_log_limiter = RateLimiter(LOG_SAMPLE_SEC)
+
+# Cache response /index/* : di-invalidasi setiap ada data baru masuk DB
+RESPONSE_CACHE_SIZE = 256
+
+# Push stream /stream (SSE): update digabung menjadi maksimal STREAM_FPS frame/detik
+STREAM_FPS = float(os.environ.get("PZEM_STREAM_FPS", 2))
+STREAM_QUEUE_SIZE = 16     # frame tertunda per koneksi sebelum klien di-resync
+STREAM_KEEPALIVE_SEC = 15
+
+# /api/readings: batas jumlah titik & rentang default
+READINGS_DEFAULT_POINTS = 500
+READINGS_MAX_POINTS = 5000
+READINGS_DEFAULT_HOURS = 24
+READINGS_LTTB_FACTOR = 4   # bucket DB = points * faktor, lalu LTTB ke `points`
+
+# /api/export: baris per chunk baca/encode (parquet: satu row group per chunk)
+EXPORT_CHUNK_ROWS = {"csv": 5000, "parquet": 65536}
+EXPORT_RETRY_AFTER_SEC = 30  # header Retry-After saat slot ekspor TimescaleDB penuh (503)
+
+# Menyimpan data terakhir dari setiap topic, beserta versi per topic & versi global
+# (naik setiap pesan valid) untuk ETag dan respon delta ?since=<versi>
+latest_data = {}
+latest_versions = {}
+latest_lock = threading.Lock()
+data_version = 0
+# Agregat live per gedung (kode gedung -> [jumlah per NUMERIC_FIELDS, jumlah sensor ber-data]),
+# diperbarui inkremental di update_latest: kurangi reading lama, tambah reading baru
+building_live = {}
+mqtt_client = None
+
+# -------------------- THREAD SAFETY --------------------
+MODEL = None
+MODEL_LOCK = threading.Lock()
+
+# --------------------- STORAGE ------------------------
+def get_storage():
+    """Backend storage aktif (dibuat sekali dari STORAGE_CONFIG)"""
+    global storage
+    if storage is None:
+        storage = create_backend(STORAGE_CONFIG)
+        log.info("storage backend=%s", storage.name)
+    return storage
+
+# ---------------------- TOPOLOGY ----------------------
+# Snapshot immutable gedung/sensor (termasuk routing topic -> sensor_id),
+# dimuat sekali dari DB lalu di-swap utuh saat topologi berubah. Pembaca cukup
+# mengambil referensi `topology` sekali per request/pesan.
+topology = EMPTY_TOPOLOGY
+route_stats = {"hits": 0, "misses": 0, "reloads": 0}
+route_stats_lock = threading.Lock()
+
+def refresh_topology():
+    """Muat ulang topologi dari DB; return True bila ada perubahan"""
+    global topology
+    snapshot = build_topology(get_storage().fetch_topology())
+    if snapshot.signature == topology.signature:
+        return False
+    topology = snapshot
+    rebuild_live_aggregates(snapshot)
+    period_totals.set_topology({
+        sensor.sensor_id: building.name
+        for building in snapshot.buildings
+        for sensor in building.sensors
+    })
+    response_cache.bump_epoch()
+    with route_stats_lock:
+        route_stats["reloads"] += 1
+    log.info("topologi dimuat buildings=%d topics=%d", len(snapshot.buildings), len(snapshot.routes))
+    return True
+
+def topology_refresh_worker(interval: int = 60):
+    """Cek perubahan sensor/gedung secara berkala (di luar jalur MQTT)"""
+    while True:
+        time.sleep(interval)
+        try:
+            refresh_topology()
+        except Exception as e:
+            log.error("refresh topologi gagal: %s", e)
+
+def get_sensor_id_from_topic(topic: str):
+    """Lookup topic sensor/<building_code>/<sensor_name> -> sensor_id (tanpa DB)"""
+    sensor_id = topology.routes.get(topic)
+    with route_stats_lock:
+        if sensor_id is None:
+            route_stats["misses"] += 1
+        else:
+            route_stats["hits"] += 1
+    return sensor_id
+
+# ----------------- PERIOD TOTALS (MEMORY) -----------------
+# Energi/biaya bulan berjalan & rolling 7/30 hari per sensor dan per gedung;
+# di-seed dari DB lalu ditambah setiap baris yang masuk DB (lihat replay_spool).
+period_totals = PeriodTotals()
+
+def month_bounds(now):
+    """Awal bulan berjalan dan detik terakhir bulan tersebut"""
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if now.month == 12:
+        next_month = month_start.replace(year=now.year + 1, month=1)
+    else:
+        next_month = month_start.replace(month=now.month + 1)
+    return month_start, next_month - timedelta(seconds=1)
+
+def seed_period_totals():
+    """Isi akumulator periode dari DB (dipanggil saat startup / setelah DB kembali)"""
+    backend = get_storage()
+    with spool_write_lock:
+        now = backend.now()
+        month_start, _ = month_bounds(now)
+        window_start = (now - timedelta(days=max(ROLLING_WINDOWS))).replace(minute=0, second=0, microsecond=0)
+        period_totals.seed(
+            now,
+            backend.range_totals_by_sensor(month_start, now),
+            backend.hourly_totals_by_sensor(window_start, now)
+        )
+    response_cache.bump_epoch()
+    log.info("period totals di-seed dari DB")
+
+# -------------------- RESPONSE CACHE --------------------
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+
+def cached_response(view):
+    """
+    Cache response per (path, query args, format hasil negosiasi) sampai epoch data
+    berikutnya, sehingga banyak tab dashboard yang polling hanya memicu satu query
+    per flush. Response selain 200 tidak di-cache.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.path, tuple(sorted(request.args.items(multi=True))), negotiate_format())
+        uncached = []
+
+        def compute():
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                uncached.append(response)
+                return None
+            return response.get_data(), response.mimetype
+
+        cached = response_cache.get_or_compute(key, compute)
+        if cached is None:
+            return uncached[0]
+        body, mimetype = cached
+        response = app.response_class(body, mimetype=mimetype)
+        response.headers["Vary"] = "Accept"
+        return response
+    return wrapper
+
+# ------------------ COLUMNAR RESPONSE ------------------
+def negotiate_format():
+    """Mimetype respon dari ?format=json|msgpack|arrow atau header Accept (default JSON)"""
+    available = columnar.available_mimetypes()
+    fmt = request.args.get("format")
+    if fmt:
+        mimetype = columnar.FORMAT_ALIASES.get(fmt)
+        return mimetype if mimetype in available else MIME_JSON
+    return request.accept_mimetypes.best_match(available, default=MIME_JSON)
+
+def columnar_response(endpoint, builder, meta, to_json):
+    """
+    Respon endpoint history: JSON (default, struktur lama dari to_json()) atau
+    encoding kolumnar biner langsung dari ColumnBuilder bila diminta klien.
+    Ukuran & waktu encode dicatat per format di /encode/stats.
+    """
+    mimetype = negotiate_format()
+    if mimetype == MIME_JSON:
+        response, seconds = columnar.timed(lambda: jsonify(to_json()))
+    else:
+        body, seconds = columnar.timed(lambda: columnar.encode(builder, mimetype, meta))
+        response = app.response_class(body, mimetype=mimetype)
+    columnar.record_encode(endpoint, mimetype, len(response.get_data()), seconds)
+    response.headers["Vary"] = "Accept"
+    return response
+
+# ------------------- WRITE-AHEAD SPOOL -------------------
+spool_write_lock = threading.Lock()
+spool_retry_at = 0.0
+
+def get_spool():
+    global spool
+    if spool is None:
+        spool = WriteAheadSpool(SPOOL_DIR)
+    return spool
+
+def replay_spool():
+    """Tulis backlog spool ke DB secara berurutan; return jumlah baris yang masuk"""
+    total = 0
+    with spool_write_lock:
+        while True:
+            rows, last_seq, position, records = get_spool().read_pending(SPOOL_REPLAY_BATCH_ROWS)
+            if not records:
+                break
+            written = get_storage().write_readings(rows)
+            get_spool().ack(last_seq, position, records, len(rows))
+            if period_totals.ready:
+                if written == len(rows):
+                    period_totals.add_rows(rows, get_storage().now())
+                else:
+                    # sebagian baris sudah ada di DB (replay ulang): seed ulang dari DB
+                    period_totals.ready = False
+            total += len(rows)
+    if total:
+        response_cache.bump_epoch()
+    return total
+
+def try_replay_spool():
+    """Replay backlog; bila DB gagal, data tetap aman di spool dan dicoba lagi nanti"""
+    global spool_retry_at
+    if time.monotonic() < spool_retry_at:
+        return 0
+    try:
+        return replay_spool()
+    except Exception as e:
+        spool_retry_at = time.monotonic() + SPOOL_RETRY_SEC
+        log.warning("DB tidak tersedia, data tetap di spool: %s", e)
+        return 0
+
+def spool_replay_worker(interval: int = SPOOL_RETRY_SEC):
+    """Bulk-load backlog spool setelah DB down atau restart"""
+    while True:
+        if not period_totals.ready:
+            try:
+                seed_period_totals()
+            except Exception as e:
+                log.warning("seed period totals gagal: %s", e)
+        if get_spool().pending_records:
+            replayed = try_replay_spool()
+            if replayed:
+                log.info("replay spool rows=%d", replayed)
+        time.sleep(interval)
+
+def save_sensor_data_batch(items):
+    """Simpan banyak data sensor [(sensor_id, data), ...]: spool dulu, lalu DB dalam satu transaksi"""
+    backend = get_storage()
+    rows = backend.build_rows(items, backend.now())
+    if not rows:
+        return 0
+    get_spool().append(rows)
+    saved = try_replay_spool()
+    log.debug("save batch rows=%d written=%d", len(rows), saved)
+    return len(rows)
+
+def save_sensor_data(sensor_id: int, data: dict):
+    """Simpan data satu sensor ke tabel sensor_readings"""
+    save_sensor_data_batch([(sensor_id, data)])
+
+# ------------------- AGGREGATION BUFFER -------------------
+agg_buffer = AggregationBuffer()
+
+# Interval sampling & tarif per deployment, dipilih dari STORAGE_CONFIG["backend"]
+# (main_mqtt: SQLite, main_timescale: TimescaleDB). Entry point yang mengganti
+# backend setelah import harus memanggil apply_billing_profile() lagi.
+BILLING_PROFILES = {
+    "sqlite": {"interval_sec": 3, "tarif_per_kwh": 1500.0, "ppj": 0.10},
+    "timescale": {"interval_sec": 10, "tarif_per_kwh": 1500.0, "ppj": 0.05}
+}
+INTERVAL_SEC = TARIF_PER_KWH = PPJ = None
+
+def apply_billing_profile(backend=None):
+    """Set INTERVAL_SEC, TARIF_PER_KWH, PPJ dari profil backend (default backend aktif); return profil"""
+    global INTERVAL_SEC, TARIF_PER_KWH, PPJ
+    backend = backend or STORAGE_CONFIG["backend"]
+    profile = BILLING_PROFILES.get(backend)
+    if profile is None:
+        raise ValueError(f"Profil tarif untuk backend tidak dikenal: {backend}")
+    INTERVAL_SEC, TARIF_PER_KWH, PPJ = profile["interval_sec"], profile["tarif_per_kwh"], profile["ppj"]
+    return profile
+
+apply_billing_profile()
+
+def accumulate_sensor_data(sensor_id: int, reading: PzemReading):
+    """Akumulasi data sensor sampai di-flush worker"""
+    daya = reading.daya
+
+    # energi in kWh for INTERVAL_SEC seconds: daya (W) * seconds / 3600 / 1000
+    energi_wh = daya * (INTERVAL_SEC / 3600.0)
+    energi_kwh = energi_wh / 1000.0
+    biaya = energi_kwh * TARIF_PER_KWH * (1 + PPJ)
+
+    count = agg_buffer.add(sensor_id, reading.tegangan, reading.arus, daya,
+                           energi_kwh, reading.frekuensi, biaya, reading.pf)
+
+    if log.isEnabledFor(logging.DEBUG) and (LOG_TRACE or ingest_log_limiter.allow(("acc", sensor_id)) is not None):
+        log.debug("akumulasi sensor_id=%s samples=%d", sensor_id, count)
+
+def drain_buffers():
+    """Ambil snapshot semua buffer sensor lalu reset, dalam satu langkah"""
+    tanggal = get_storage().now().strftime("%Y-%m-%d %H:%M:%S")
+    items = []
+    for sensor_id, sums, count in agg_buffer.drain():
+        tegangan, arus, daya, energi, frekuensi, biaya, pf = sums
+        payload = {
+            "tegangan": tegangan / count,
+            "arus": arus / count,
+            "daya": daya,          # total daya samples sum (as previously)
+            "energi": energi,      # accumulated kWh
+            "frekuensi": frekuensi / count,
+            "biaya": biaya,
+            "tanggal": tanggal,
+            "pf": pf / count
+        }
+        items.append((sensor_id, payload, count))
+    return items
+
+flush_stats = {"flushes": 0, "rows": 0, "samples": 0, "errors": 0}
+flush_stats_lock = threading.Lock()
+
+def flush_buffers():
+    """Flush semua buffer sensor ke database dalam satu transaksi"""
+    items = drain_buffers()
+    if not items:
+        return 0
+    save_sensor_data_batch([(sensor_id, payload) for sensor_id, payload, _ in items])
+    samples = sum(count for _, _, count in items)
+    with flush_stats_lock:
+        flush_stats["flushes"] += 1
+        flush_stats["rows"] += len(items)
+        flush_stats["samples"] += samples
+    log.debug("flush sensors=%d samples=%d", len(items), samples)
+    return len(items)
+
+def flush_worker(interval: int = 60):
+    while True:
+        time.sleep(interval)
+        try:
+            flush_buffers()
+        except Exception as e:
+            with flush_stats_lock:
+                flush_stats["errors"] += 1
+            log.error("flush_buffers gagal: %s", e)
+
+# ------------------- LATEST DATA (VERSIONED) -------------------
+def _apply_live(building_code, old, new):
+    entry = building_live.get(building_code)
+    if entry is None:
+        entry = building_live[building_code] = [[0.0] * len(NUMERIC_FIELDS), 0]
+    sums = entry[0]
+    if old is None:
+        entry[1] += 1
+    else:
+        for i, value in enumerate(old[:len(NUMERIC_FIELDS)]):
+            sums[i] -= value
+    for i, value in enumerate(new[:len(NUMERIC_FIELDS)]):
+        sums[i] += value
+
+def update_latest(topic: str, sensor_id: int, reading: PzemReading):
+    global data_version
+    topo = topology
+    sensor = topo.by_sensor_id.get(sensor_id)
+    with latest_lock:
+        data_version += 1
+        old = latest_data.get(topic)
+        latest_data[topic] = reading
+        latest_versions[topic] = data_version
+        if sensor is not None:
+            _apply_live(topo.buildings[sensor.building_index].code, old, reading)
+
+def rebuild_live_aggregates(topo):
+    """Hitung ulang agregat live dari latest_data (saat topologi berubah; sekaligus reset drift float)"""
+    with latest_lock:
+        building_live.clear()
+        for building in topo.buildings:
+            for sensor in building.sensors:
+                reading = latest_data.get(sensor.topic)
+                if reading is not None:
+                    _apply_live(building.code, None, reading)
+
+def changed_topics(since: int):
+    """Set topic yang di-update setelah versi `since`"""
+    with latest_lock:
+        return {topic for topic, version in latest_versions.items() if version > since}
+
+def live_etag():
+    """ETag respon live: versi data sensor + epoch data DB + generasi topologi"""
+    return f"{data_version}-{response_cache.epoch}-{route_stats['reloads']}"
+
+def conditional_json(build):
+    """
+    Respon JSON dengan ETag; 304 tanpa menghitung ulang bila If-None-Match cocok.
+    build(version) dipanggil dengan versi data saat ETag diambil.
+    """
+    version = data_version
+    etag = live_etag()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build(version))
+    response.set_etag(etag)
+    # paksa browser revalidasi (If-None-Match) di setiap polling
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Data-Version"] = str(version)
+    return response
+
+# ---------------------- MQTT HANDLER -------------------
+def handle_sensor_message(sensor_id: int, reading: PzemReading):
+    try:
+        accumulate_sensor_data(sensor_id, reading)
+    except Exception as e:
+        log.error("akumulasi sensor_id=%s gagal: %s", sensor_id, e)
+
+def handle_message(topic: str, payload: bytes, client: mqtt.Client):
+    sensor_id = get_sensor_id_from_topic(topic)
+    if sensor_id:
+        # validasi sekali di sini; setelahnya semua nilai sudah float
+        reading = decode_payload(payload)
+        if reading is None:
+            return
+        update_latest(topic, sensor_id, reading)
+        live_stream.mark_dirty(sensor_id)
+        handle_sensor_message(sensor_id, reading)
+    elif topic == TOPIC_PREDICT:
+        # handle predict topic if needed
+        pass
+    else:
+        suppressed = ingest_log_limiter.allow(("topic", topic))
+        if suppressed is not None:
+            log.warning("topik tidak dikenali topic=%s suppressed=%d", topic, suppressed)
+
+# ---------------------- INGEST QUEUE -------------------
+# on_message hanya mengantrikan pesan mentah; decode & akumulasi dikerjakan
+# oleh pool worker supaya network loop paho tidak pernah tertahan. Satu antrian
+# per worker, dipilih dari hash topic: pesan satu sensor selalu diproses
+# berurutan oleh worker yang sama.
+INGEST_QUEUE_SIZE = int(os.environ.get("PZEM_INGEST_QUEUE_SIZE", 10000))   # total semua antrian
+INGEST_WORKERS = max(1, int(os.environ.get("PZEM_INGEST_WORKERS", 2)))
+
+ingest_queues = [queue.Queue(maxsize=max(1, INGEST_QUEUE_SIZE // INGEST_WORKERS)) for _ in range(INGEST_WORKERS)]
+ingest_stats = {"enqueued": 0, "dropped": 0, "processed": 0, "errors": 0,
+                "latency_sum": 0.0, "latency_max": 0.0}
+ingest_stats_lock = threading.Lock()
+
+def enqueue_message(topic: str, payload: bytes):
+    """Masukkan pesan mentah ke antrian; buang bila antrian penuh"""
+    try:
+        ingest_queues[zlib.crc32(topic.encode()) % len(ingest_queues)].put_nowait((topic, payload, time.monotonic()))
+    except queue.Full:
+        with ingest_stats_lock:
+            ingest_stats["dropped"] += 1
+            dropped = ingest_stats["dropped"]
+        if dropped % 1000 == 1:
+            log.warning("antrian ingest penuh, pesan dibuang dropped=%d", dropped)
+        return False
+    with ingest_stats_lock:
+        ingest_stats["enqueued"] += 1
+    return True
+
+def ingest_queue_depth():
+    return sum(q.qsize() for q in ingest_queues)
+
+def ingest_worker(ingest_queue):
+    while True:
+        topic, payload, received = ingest_queue.get()
+        ok = True
+        try:
+            handle_message(topic, payload, mqtt_client)
+        except Exception as e:
+            ok = False
+            log.error("ingest_worker topic=%s gagal: %s", topic, e)
+        latency = time.monotonic() - received
+        with ingest_stats_lock:
+            ingest_stats["processed"] += 1
+            if not ok:
+                ingest_stats["errors"] += 1
+            ingest_stats["latency_sum"] += latency
+            if latency > ingest_stats["latency_max"]:
+                ingest_stats["latency_max"] = latency
+
+def start_ingest_workers():
+    for i, ingest_queue in enumerate(ingest_queues):
+        threading.Thread(target=ingest_worker, args=(ingest_queue,), name=f"ingest-{i}", daemon=True).start()
+
+# ---------------------- RETENTION ---------------------
+def run_retention():
+    """Satu putaran retensi; simpan laporan terakhir di retention_stats"""
+    report = get_storage().apply_retention(RETENTION_CONFIG["raw_days"], RETENTION_CONFIG["hourly_months"])
+    with retention_stats_lock:
+        retention_stats["runs"] += 1
+        retention_stats["deleted_raw"] += report.get("deleted_raw", 0)
+        retention_stats["deleted_hourly"] += report.get("deleted_hourly", 0)
+        retention_stats["reclaimed_bytes"] += max(0, report.get("reclaimed_bytes", 0))
+        retention_stats["last"] = report
+    if report.get("deleted_raw") or report.get("deleted_hourly"):
+        response_cache.bump_epoch()
+    log.info("retention selesai %s", " ".join(f"{k}={v}" for k, v in report.items() if k != "jobs"))
+    return report
+
+def retention_worker(interval: int = RETENTION_CONFIG["interval_sec"]):
+    if RETENTION_CONFIG["raw_days"] <= max(ROLLING_WINDOWS):
+        log.warning("raw_days=%d tidak lebih panjang dari jendela rolling %d hari",
+                    RETENTION_CONFIG["raw_days"], max(ROLLING_WINDOWS))
+    while True:
+        try:
+            run_retention()
+        except Exception as e:
+            with retention_stats_lock:
+                retention_stats["errors"] += 1
+            log.error("retention gagal: %s", e)
+        time.sleep(interval)
+
+def readings_migration_worker():
+    """Migrasi online data pembacaan format lama (sekali saat startup, di background)"""
+    try:
+        report = get_storage().migrate_legacy_readings()
+    except Exception as e:
+        log.error("migrasi readings gagal: %s", e)
+        return
+    if report and (report["moved"] or report["invalid"]):
+        response_cache.bump_epoch()
+        log.info("migrasi readings selesai %s", " ".join(f"{k}={v}" for k, v in report.items()))
+
+# ---------------------- LOG SUMMARY -------------------
+def log_summary_worker(interval: int = LOG_SUMMARY_SEC):
+    """Ganti log per pesan dengan satu baris ringkasan per interval"""
+    prev = {}
+    while True:
+        time.sleep(interval)
+        with ingest_stats_lock:
+            current = {"processed": ingest_stats["processed"], "dropped": ingest_stats["dropped"],
+                       "errors": ingest_stats["errors"]}
+        with flush_stats_lock:
+            current.update(flushes=flush_stats["flushes"], rows=flush_stats["rows"],
+                           flush_errors=flush_stats["errors"])
+        decode = get_decode_stats()
+        current["rejected"] = decode["invalid_json"] + decode["not_object"] + decode["bad_field"]
+        delta = {k: v - prev.get(k, 0) for k, v in current.items()}
+        prev = current
+        log.info(
+            "ingest summary interval=%ds msg_per_s=%.2f processed=%d dropped=%d rejected=%d "
+            "errors=%d flushes=%d rows=%d flush_errors=%d queue_depth=%d spool_pending=%d",
+            interval, delta["processed"] / interval, delta["processed"], delta["dropped"],
+            delta["rejected"], delta["errors"], delta["flushes"], delta["rows"],
+            delta["flush_errors"], ingest_queue_depth(), get_spool().pending_records
+        )
+
+# ---------------------- MQTT CALLBACK ------------------
+def on_connect(client, userdata, flags, rc):
+    if rc == 0:
+        log.info("connected to MQTT broker=%s:%s", BROKER, PORT)
+        client.subscribe([(TOPIC_PATTERN, 0), (TOPIC_PREDICT, 0)])
+    else:
+        log.error("MQTT connect failed rc=%s", rc)
+
+def on_message(client, userdata, msg):
+    enqueue_message(msg.topic, msg.payload)
+
+def start_mqtt(loop_forever=False):
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(BROKER, PORT, 60)
+    client.loop_start()
+    return client
+
+# ------------------------ GET BUILDINGS & SENSORS ------------------------
+@app.route("/routes/stats")
+def get_route_stats():
+    """Statistik routing table topic -> sensor_id"""
+    with route_stats_lock:
+        stats = dict(route_stats)
+    stats["topics"] = len(topology.routes)
+    stats["buildings"] = len(topology.buildings)
+    return jsonify(stats)
+
+@app.route("/ingest/stats")
+def get_ingest_stats():
+    """Kedalaman antrian, jumlah drop dan latency enqueue -> processed"""
+    with ingest_stats_lock:
+        stats = dict(ingest_stats)
+    latency_sum = stats.pop("latency_sum")
+    stats["queue_depth"] = ingest_queue_depth()
+    stats["queue_depths"] = [q.qsize() for q in ingest_queues]
+    stats["queue_size"] = INGEST_QUEUE_SIZE
+    stats["workers"] = INGEST_WORKERS
+    stats["latency_avg_ms"] = round(latency_sum / stats["processed"] * 1000, 3) if stats["processed"] else 0.0
+    stats["latency_max_ms"] = round(stats.pop("latency_max") * 1000, 3)
+    return jsonify(stats)
+
+@app.route("/retention/stats")
+def get_retention_stats():
+    """Konfigurasi retensi, total baris terhapus & ruang yang kembali, laporan putaran terakhir"""
+    with retention_stats_lock:
+        stats = dict(retention_stats)
+    stats["config"] = RETENTION_CONFIG
+    return jsonify(stats)
+
+@app.route("/spool/stats")
+def get_spool_stats():
+    """Backlog spool write-ahead yang belum masuk DB"""
+    return jsonify(get_spool().stats())
+
+@app.route("/cache/stats")
+def get_cache_stats():
+    """Hit/miss cache response /index/*"""
+    return jsonify(response_cache.get_stats())
+
+@app.route("/encode/stats")
+def get_encode_stats():
+    """Ukuran & waktu encode respon history per format (JSON vs msgpack vs Arrow)"""
+    return jsonify(columnar.get_encode_stats())
+
+@app.route("/ingest/decoder-stats")
+def get_decoder_stats():
+    """Jumlah payload valid & ditolak per alasan"""
+    return jsonify(get_decode_stats())
+
+# ------------------------ BACKEND DASHBOARD PUSAT ------------------------
+# ======================== REALTIME DATA ========================
+@app.route("/")
+def index_page():
+    """Render halaman dashboard"""
+    return render_template("view_mode.html")
+
+@app.route("/realtime")
+def get_realtime():
+    """
+    Data live + total bulanan per departemen. Mendukung ETag/If-None-Match dan
+    ?since=<versi> (hanya departemen & fase yang berubah setelah versi tersebut).
+    """
+    since = request.args.get("since", type=int)
+    return conditional_json(lambda version: build_realtime(version, since))
+
+def build_realtime(version, since=None):
+    backend = get_storage()
+    now = backend.now()
+
+    # Awal dan akhir bulan
+    month_start, month_end = month_bounds(now)
+
+    topo = topology
+    departments = []
+    changed = changed_topics(since) if since is not None else None
+
+    # Total bulanan dari akumulator memori; fallback satu query GROUP BY sensor_id
+    if period_totals.ready:
+        monthly_totals = period_totals.sensors("month", now)
+    else:
+        monthly_totals = backend.range_totals_by_sensor(month_start, month_end)
+
+    total_energy_all = 0.0
+    total_cost_all = 0.0
+
+    for building in topo.buildings:
+        phases = {}
+        total_energy = 0.0
+        total_cost = 0.0
+
+        for sensor in building.sensors:
+            energy, cost = monthly_totals.get(sensor.sensor_id, (0.0, 0.0))
+            total_energy += energy
+            total_cost += cost
+
+            if changed is not None and sensor.topic not in changed:
+                continue
+
+            # Default nilai jika belum ada data MQTT
+            sensor_data = latest_data.get(sensor.topic, EMPTY_READING)
+
+            phases[sensor.phase_key] = {
+                "voltage": sensor_data.tegangan,
+                "current": sensor_data.arus,
+                "power": sensor_data.daya,
+                "energy": sensor_data.energi
+            }
+
+        total_energy_all += total_energy
+        total_cost_all += total_cost
+
+        if changed is not None and not phases:
+            continue
+
+        departments.append({
+            "id": building.code,
+            "name": building.name,
+            "phases": phases,
+            "total": {
+                "total_energy": total_energy,
+                "total_cost": total_cost
+            }
+        })
+
+    summary = {
+        "overall_energy": round(total_energy_all, 4),
+        "overall_cost": round(total_cost_all, 0),
+        "month": now.strftime("%B"),
+        "year": now.year
+    }
+
+    return {
+        "success": True,
+        "timestamp": now.isoformat(),
+        "version": version,
+        "departments": departments,
+        "summary": summary
+    }
+
+# ------------------------ DASHBOARD ADMIN API ------------------------
+@app.route("/admin")
+def admin_page():
+    return render_template("realtime_fetch.html")
+
+DAYA_INDEX = NUMERIC_FIELDS.index('daya')
+
+def energi_from_daya(daya_total):
+    """Estimasi energi (kWh) dari total daya selama INTERVAL_SEC detik"""
+    energi_val = (daya_total * INTERVAL_SEC) / 3600 / 1000
+    if 0 < energi_val < 0.001:
+        return float(f"{energi_val:.7e}")
+    return round(energi_val, 6)
+
+def summarize_building(building, field=None):
+    """
+    Ringkasan live satu gedung dari agregat building_live (tanpa iterasi sensor):
+    rata-rata per field, daya dijumlah, energi dihitung dari total daya.
+    Return None bila belum ada sensor yang mengirim data.
+    """
+    with latest_lock:
+        entry = building_live.get(building.code)
+        if entry is None or entry[1] == 0:
+            return None
+        sums, count = tuple(entry[0]), entry[1]
+
+    daya_total = sums[DAYA_INDEX]
+    if not field:
+        averaged = {}
+        for k, v in zip(NUMERIC_FIELDS, sums):
+            if k == "daya":
+                averaged[k] = round(daya_total, 3)
+            elif k == "energi":
+                averaged[k] = energi_from_daya(daya_total)
+            else:
+                averaged[k] = round(v / count, 3)
+        return averaged
+
+    key = field.lower()
+    if key in ["energi", "energy"]:
+        return {"daya": round(daya_total, 3), "energi": energi_from_daya(daya_total)}
+    if key in ["daya", "power"]:
+        # hanya nama field persis 'daya' yang punya nilai (sama dengan perilaku sebelumnya)
+        return {field: round(daya_total if field == "daya" else 0.0, 3)}
+    value = sums[NUMERIC_FIELDS.index(field)] if field in NUMERIC_FIELDS else 0.0
+    return {field: round(value / count, 3)}
+
+@app.route("/dashboard-admin", methods=["GET"])
+def get_dashboard():
+    """
+    Ringkasan live per gedung. Mendukung ETag/If-None-Match; ?since=<versi> hanya
+    mengembalikan gedung yang sensornya berubah (versi terbaru di header X-Data-Version).
+    """
+    field = request.args.get("field")
+    since = request.args.get("since", type=int)
+
+    def build(version):
+        changed = changed_topics(since) if since is not None else None
+        results = {}
+        for building in topology.buildings:
+            if changed is not None and not any(s.topic in changed for s in building.sensors):
+                continue
+            summary = summarize_building(building, field)
+            if summary is not None:
+                results[building.name] = summary
+        return results
+
+    return conditional_json(build)
+
+# ======================== LIVE STREAM ========================
+def build_live_frame(sensor_ids):
+    """Frame stream untuk sensor yang berubah: per gedung ringkasan live + reading sensor"""
+    topo = topology
+    frame = {}
+    for sensor_id in sensor_ids:
+        sensor = topo.by_sensor_id.get(sensor_id)
+        if sensor is None:
+            continue
+        building = topo.buildings[sensor.building_index]
+        entry = frame.get(building.name)
+        if entry is None:
+            entry = frame[building.name] = {
+                "code": building.code,
+                "summary": summarize_building(building),
+                "sensors": {}
+            }
+        reading = latest_data.get(sensor.topic)
+        if reading is not None:
+            entry["sensors"][sensor.sensor_name] = reading._asdict()
+    return frame
+
+live_stream = LiveBroadcaster(build_live_frame, fps=STREAM_FPS, queue_size=STREAM_QUEUE_SIZE)
+
+def live_snapshot(buildings=None):
+    """Event SSE berisi keadaan penuh (saat connect / setelah klien tertinggal)"""
+    frame = build_live_frame([sensor.sensor_id for sensor in topology.sensors])
+    return LiveBroadcaster.encode("snapshot", frame, buildings) or "event: snapshot\ndata: {}\n\n"
+
+@app.route("/stream")
+def live_stream_endpoint():
+    """
+    Server-Sent Events update sensor & ringkasan gedung.
+    ?buildings=department1,department2 membatasi ke kode gedung tertentu.
+    """
+    codes = [c for c in request.args.get("buildings", "").split(",") if c]
+    subscriber = live_stream.subscribe(codes or None)
+
+    def generate():
+        try:
+            yield live_snapshot(subscriber.buildings)
+            while True:
+                try:
+                    event = subscriber.queue.get(timeout=STREAM_KEEPALIVE_SEC)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscriber.resync:
+                    subscriber.resync = False
+                    subscriber.drain()
+                    event = live_snapshot(subscriber.buildings)
+                yield event
+        finally:
+            live_stream.unsubscribe(subscriber)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/stream/stats")
+def get_stream_stats():
+    """Jumlah subscriber, frame terkirim dan frame yang dibuang untuk klien lambat"""
+    return jsonify(live_stream.get_stats())
+
+# ======================== ENERGY USAGE ========================
+@app.route("/index/energy-usage")
+@cached_response
+def energy_usage():
+    """
+    Get energy usage untuk line chart (per gedung, jumlah dari semua sensor).
+    Format kolumnar: satu baris per (building, jam, energy).
+    """
+    backend = get_storage()
+    datasets = []
+    labels = []
+    columns = ColumnBuilder((("building", "string"), ("jam", "string"), ("energy", "float64")))
+
+    for building in topology.buildings:
+        energy_per_hour = {}
+
+        for sensor in building.sensors:
+            for jam, energi in backend.hourly_energy(sensor.sensor_id, limit=60):
+                energy_per_hour[jam] = energy_per_hour.get(jam, 0) + energi
+
+        sorted_times = sorted(energy_per_hour.keys())
+        usage = [energy_per_hour[j] for j in sorted_times]
+        for jam, energi in zip(sorted_times, usage):
+            columns.append(building.name, jam, energi)
+
+        datasets.append({
+            "building": building.name,
+            "usage": usage
+        })
+
+        if not labels and sorted_times:
+            labels = sorted_times
+
+    return columnar_response("/index/energy-usage", columns, {"unit": "kWh"}, lambda: {
+        "labels": labels,
+        "datasets": datasets
+    })
+
+
+# ======================== PIE CHART ========================
+@app.route("/index/energy-pie")
+@cached_response
+def energy_pie():
+    """Get energy distribution untuk pie chart"""
+    period = request.args.get('period', 'minggu')
+
+    backend = get_storage()
+    end_date = backend.now()
+    if period == 'minggu':
+        days = 7
+        period_label = "Minggu Ini"
+    else:
+        days = 30
+        period_label = "Bulan Ini"
+    start_date = end_date - timedelta(days=days)
+
+    labels = []
+    values = []
+    total_energy = 0.0
+
+    # Dari akumulator memori; fallback query per sensor bila belum di-seed
+    building_totals = period_totals.buildings(days, end_date) if period_totals.ready else None
+
+    for building in topology.buildings:
+        if building_totals is not None:
+            building_total = building_totals.get(building.name, (0.0, 0.0))[0]
+        else:
+            building_total = 0.0
+            for sensor in building.sensors:
+                try:
+                    energy, _ = backend.range_totals(sensor.sensor_id, start_date, end_date)
+                    building_total += energy
+                except Exception as e:
+                    log.error("query energy-pie sensor_id=%s gagal: %s", sensor.sensor_id, e)
+
+        labels.append(building.name)
+        values.append(building_total)
+        total_energy += building_total
+
+    return jsonify({
+        "labels": labels,
+        "values": values,
+        "period": period,
+        "period_label": period_label,
+        "total_energy": total_energy,
+        "start_date": backend.format_time(start_date),
+        "end_date": backend.format_time(end_date)
+    })
+
+
+# ======================== STATS ========================
+@app.route("/index/stats")
+@cached_response
+def get_stats():
+    """Get statistics untuk dashboard"""
+    period = request.args.get('period', 'minggu')
+
+    backend = get_storage()
+    end_date = backend.now()
+    days = 7 if period == 'minggu' else 30
+    start_date = end_date - timedelta(days=days)
+
+    total_energy = 0.0
+    total_cost = 0.0
+
+    # Dari akumulator memori; fallback satu query GROUP BY bila belum di-seed
+    if period_totals.ready:
+        total_energy, total_cost = period_totals.overall(days, end_date)
+    else:
+        try:
+            for energy, cost in backend.range_totals_by_sensor(start_date, end_date).values():
+                total_energy += energy
+                total_cost += cost
+        except Exception as e:
+            log.error("query stats gagal: %s", e)
+
+    return jsonify({
+        "period": period,
+        "total_energy": total_energy,
+        "total_cost": total_cost,
+        "energy_formatted": f"{total_energy:,.4f} kWh",
+        "cost_formatted": f"IDR {total_cost:,.0f}",
+        "start_date": backend.format_time(start_date),
+        "end_date": backend.format_time(end_date)
+    })
+
+# ======================== READINGS API ========================
+# Alias nama field payload (Indonesia) -> kolom sensor_readings
+METRIC_ALIASES = {
+    "tegangan": "voltage", "arus": "current", "daya": "power", "energi": "energy",
+    "frekuensi": "frequency", "biaya": "cost", "pf": "power_factor"
+}
+
+def parse_time_arg(name, default, now):
+    value = request.args.get(name)
+    if not value:
+        return default
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None and now.tzinfo is not None:
+        dt = dt.replace(tzinfo=now.tzinfo)
+    elif dt.tzinfo is not None and now.tzinfo is None:
+        # SQLite menyimpan waktu lokal naive: ubah offset dari klien ke waktu lokal
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+def select_sensors(building_arg, sensor_arg):
+    """Sensor yang diminta: satu sensor (id atau nama dalam gedung) atau semua sensor gedung"""
+    topo = topology
+    building = None
+    if building_arg:
+        building = next((b for b in topo.buildings if building_arg in (b.code, b.name)), None)
+        if building is None:
+            raise ValueError(f"gedung tidak dikenal: {building_arg}")
+    if sensor_arg:
+        if sensor_arg.isdigit() and int(sensor_arg) in topo.by_sensor_id:
+            sensor = topo.by_sensor_id[int(sensor_arg)]
+        elif building is not None:
+            sensor = next((s for s in building.sensors if s.sensor_name == sensor_arg), None)
+        else:
+            sensor = None
+        if sensor is None:
+            raise ValueError(f"sensor tidak dikenal: {sensor_arg}")
+        return topo.buildings[sensor.building_index], [sensor]
+    if building is None:
+        raise ValueError("parameter building atau sensor wajib diisi")
+    return building, list(building.sensors)
+
+@app.route("/api/readings")
+@cached_response
+def get_readings():
+    """
+    Deret waktu satu metric untuk satu sensor atau satu gedung:
+    /api/readings?building=&sensor=&metric=&from=&to=&points=&mode=lttb|minmax
+    Bucketing di DB, lalu downsampling (LTTB / min-max per bucket) ke maksimal `points` titik.
+    Metric kumulatif (energy, cost) dijumlah per bucket.
+    """
+    backend = get_storage()
+    now = backend.now()
+    try:
+        building, sensors = select_sensors(request.args.get("building"), request.args.get("sensor"))
+        metric = request.args.get("metric", "power")
+        metric = METRIC_ALIASES.get(metric, metric)
+        if metric not in SERIES_METRICS:
+            raise ValueError(f"metric tidak dikenal: {metric}")
+        end = parse_time_arg("to", now, now)
+        start = parse_time_arg("from", end - timedelta(hours=READINGS_DEFAULT_HOURS), now)
+        if start >= end:
+            raise ValueError("from harus sebelum to")
+        points = request.args.get("points", READINGS_DEFAULT_POINTS, type=int)
+        points = max(4, min(points, READINGS_MAX_POINTS))
+        mode = request.args.get("mode", "lttb")
+        if mode not in ("lttb", "minmax"):
+            raise ValueError(f"mode tidak dikenal: {mode}")
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    if SERIES_METRICS[metric][0] == "SUM":
+        mode, buckets = "sum", points
+    elif mode == "minmax":
+        buckets = points // 2
+    else:
+        buckets = points * READINGS_LTTB_FACTOR
+    # bucket sejajar kelipatan bucket_sec, jadi rentang bisa menyentuh satu bucket ekstra
+    bucket_sec = max(1, math.ceil((end - start).total_seconds() / max(1, buckets - 1)))
+
+    rows = backend.bucketed_series([s.sensor_id for s in sensors], metric, start, end, bucket_sec)
+    if rows and rows[0][0] < start:
+        # bucket pertama dimulai di kelipatan bucket_sec sebelum `from`: labeli dengan `from`
+        rows[0] = (start, *rows[0][1:])
+    if mode == "minmax":
+        series = minmax([(ts, value, low, high) for ts, value, low, high in rows])
+    else:
+        series = [(ts, value) for ts, value, _, _ in rows]
+        if mode == "lttb" and len(series) > points:
+            by_epoch = lttb([(ts.timestamp(), value) for ts, value in series], points)
+            times = {ts.timestamp(): ts for ts, _ in series}
+            series = [(times[x], value) for x, value in by_epoch]
+
+    columns = ColumnBuilder((("time", "int64"), ("value", "float64")))
+    for ts, value in series:
+        columns.append(int(ts.timestamp()), value)
+    meta = {
+        "building": building.code,
+        "sensors": [s.sensor_id for s in sensors],
+        "metric": metric,
+        "mode": mode,
+        "bucket_sec": bucket_sec,
+        "from": backend.format_time(start),
+        "to": backend.format_time(end)
+    }
+    return columnar_response("/api/readings", columns, meta, lambda: {
+        "success": True,
+        **meta,
+        "points": len(series),
+        "timestamps": [backend.format_time(ts) for ts, _ in series],
+        "values": [value for _, value in series]
+    })
+
+@app.route("/api/export")
+def export_readings():
+    """
+    Ekspor pembacaan mentah sebagai stream:
+    /api/export?from=&to=&buildings=department1,department2&format=csv|parquet
+    Rentang [from, to) (default 24 jam terakhir), buildings kosong = semua gedung.
+    Dibaca per chunk (fetchmany / server-side cursor) dan di-encode per chunk;
+    CSV di-gzip sambil streaming bila klien mengirim Accept-Encoding: gzip.
+    """
+    backend = get_storage()
+    now = backend.now()
+    topo = topology
+    try:
+        fmt = request.args.get("format", "csv")
+        if fmt not in export.available_formats():
+            raise ValueError(f"format tidak didukung: {fmt} (tersedia: {', '.join(export.available_formats())})")
+        end = parse_time_arg("to", now, now)
+        start = parse_time_arg("from", end - timedelta(hours=READINGS_DEFAULT_HOURS), now)
+        if start >= end:
+            raise ValueError("from harus sebelum to")
+        codes = [c for c in request.args.get("buildings", "").split(",") if c]
+        buildings = [b for b in topo.buildings if not codes or b.code in codes or b.name in codes]
+        unknown = set(codes) - {b.code for b in buildings} - {b.name for b in buildings}
+        if unknown:
+            raise ValueError(f"gedung tidak dikenal: {', '.join(sorted(unknown))}")
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if backend.export_busy():
+        export.record_rejected(fmt)
+        return jsonify({"success": False, "error": "ekspor lain sedang berjalan, coba lagi nanti"}), 503, \
+            {"Retry-After": str(EXPORT_RETRY_AFTER_SEC)}
+
+    sensors = {s.sensor_id: (b.code, s.sensor_name) for b in buildings for s in b.sensors}
+    rows_sent = [0]
+
+    def batches():
+        for rows in backend.iter_readings(list(sensors), start, end, EXPORT_CHUNK_ROWS[fmt]):
+            rows_sent[0] += len(rows)
+            yield [(ts, *sensors[sensor_id], sensor_id, v, i, p, e, f, pf, cost)
+                   for sensor_id, ts, v, i, p, e, f, cost, pf in rows]
+
+    if fmt == "csv":
+        chunks = export.csv_chunks(batches(), backend.format_time)
+    else:
+        chunks = export.parquet_chunks(batches())
+    headers = {
+        "Content-Disposition": f'attachment; filename="pzem_{start:%Y%m%d%H%M}_{end:%Y%m%d%H%M}.{fmt}"',
+        "Vary": "Accept-Encoding",
+        "X-Accel-Buffering": "no"
+    }
+    if fmt == "csv" and request.accept_encodings["gzip"]:
+        chunks = export.gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+
+    def generate():
+        started = time.monotonic()
+        size = 0
+        completed = False
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+            completed = True
+        finally:
+            export.record_export(fmt, rows_sent[0], size, time.monotonic() - started, completed)
+
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+@app.route("/export/stats")
+def get_export_stats():
+    """Jumlah ekspor per format, baris & bytes terkirim, throughput"""
+    return jsonify(export.get_export_stats())
+
+# ------------------------ MAIN STARTUP ------------------------
+def run(port: int = 5000):
+    global mqtt_client
+    setup_logging(LOG_LEVEL, trace=LOG_TRACE)
+    apply_billing_profile()
+    backend = get_storage()
+    backend.seed_if_empty(DEFAULT_BUILDINGS)
+
+    refresh_topology()
+    threading.Thread(target=topology_refresh_worker, args=(60,), daemon=True).start()
+    try:
+        seed_period_totals()
+    except Exception as e:
+        log.warning("seed period totals gagal, dicoba lagi oleh spool worker: %s", e)
+
+    threading.Thread(target=log_summary_worker, daemon=True).start()
+    # replay backlog spool dari outage/restart sebelumnya
+    threading.Thread(target=spool_replay_worker, daemon=True).start()
+    threading.Thread(target=retention_worker, daemon=True).start()
+    threading.Thread(target=readings_migration_worker, daemon=True).start()
+
+    start_ingest_workers()
+    live_stream.start()
+    mqtt_client = start_mqtt(loop_forever=False)
+    # start flush worker (flush every 60 seconds)
+    threading.Thread(target=flush_worker, args=(60,), daemon=True).start()
+
+    # Run Flask
+    app.run(host="0.0.0.0", port=port, debug=True, use_reloader=False)
+
+if __name__ == '__main__':
+    run(port=int(os.environ.get("PZEM_PORT", 5000)))
@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+ACK_FILE = "ack.json"
+
+def _encode_row(row):
+    # kolom ke-2 adalah timestamp (datetime dari backend.now())
+    row = list(row)
+    if isinstance(row[1], datetime):
+        row[1] = row[1].isoformat()
+    return row
+
+def _decode_row(row):
+    row[1] = datetime.fromisoformat(row[1])
+    return tuple(row)
+
+
+class WriteAheadSpool:
+    """
+    Spool append-only berbasis file segmen untuk hasil flush agregasi.
+    Setiap batch ditulis (fsync) sebagai satu baris JSON {"seq", "rows"} sebelum
+    ditulis ke DB. Posisi batch terakhir yang sudah masuk DB disimpan di ack.json;
+    segmen yang seluruh isinya sudah di-ack dihapus.
+    """
+
+    def __init__(self, directory="spool", segment_bytes=4 * 1024 * 1024, fsync=True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    # ------------------------- file -------------------------
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment:06d}{SEGMENT_SUFFIX}")
+
+    def _segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                segments.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        return sorted(segments)
+
+    def _read_ack(self):
+        path = os.path.join(self.directory, ACK_FILE)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_ack(self):
+        path = os.path.join(self.directory, ACK_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"seq": self.acked_seq, "segment": self.ack_segment, "offset": self.ack_offset}, f)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _scan(self, segment, offset):
+        """Iterasi (seq, rows, end_offset) dari segmen mulai offset; berhenti di baris rusak"""
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    return
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    return
+                offset += len(line)
+                yield record["seq"], record["rows"], offset
+
+    def _recover(self):
+        """Muat posisi ack, potong baris terakhir yang tidak utuh, hitung backlog"""
+        segments = self._segments()
+        ack = self._read_ack()
+        if ack:
+            self.acked_seq, self.ack_segment, self.ack_offset = ack["seq"], ack["segment"], ack["offset"]
+        else:
+            self.acked_seq, self.ack_segment, self.ack_offset = 0, (segments[0] if segments else 1), 0
+
+        if not segments:
+            segments = [self.ack_segment]
+            open(self._segment_path(self.ack_segment), "ab").close()
+
+        last_seq = self.acked_seq
+        self.pending_records = 0
+        self.pending_rows = 0
+        for segment in segments:
+            if segment < self.ack_segment:
+                continue
+            offset = self.ack_offset if segment == self.ack_segment else 0
+            end = offset
+            for seq, rows, end in self._scan(segment, offset):
+                last_seq = max(last_seq, seq)
+                self.pending_records += 1
+                self.pending_rows += len(rows)
+            if segment == segments[-1] and end < os.path.getsize(self._segment_path(segment)):
+                # buang tail yang tidak utuh (crash di tengah append)
+                with open(self._segment_path(segment), "r+b") as f:
+                    f.truncate(end)
+
+        self.next_seq = last_seq + 1
+        self.active_segment = segments[-1]
+        self._fh = open(self._segment_path(self.active_segment), "ab")
+
+    def _rotate(self):
+        self._fh.close()
+        self.active_segment += 1
+        self._fh = open(self._segment_path(self.active_segment), "ab")
+
+    # ------------------------- API --------------------------
+    def append(self, rows):
+        """Tambahkan satu batch baris (durable sebelum return); return seq batch"""
+        with self.lock:
+            seq = self.next_seq
+            line = json.dumps({"seq": seq, "rows": [_encode_row(r) for r in rows]},
+                              separators=(",", ":")).encode() + b"\n"
+            if self._fh.tell() > 0 and self._fh.tell() + len(line) > self.segment_bytes:
+                self._rotate()
+            self._fh.write(line)
+            self._fh.flush()
+            if self.fsync:
+                os.fsync(self._fh.fileno())
+            self.next_seq += 1
+            self.pending_records += 1
+            self.pending_rows += len(rows)
+            return seq
+
+    def read_pending(self, max_rows=5000):
+        """
+        Baca batch yang belum di-ack secara berurutan sampai ~max_rows baris.
+        Return (rows, last_seq, position, records); position diteruskan ke ack().
+        """
+        with self.lock:
+            segment, offset = self.ack_segment, self.ack_offset
+            active = self.active_segment
+
+        rows = []
+        last_seq = None
+        records = 0
+        while segment <= active:
+            if os.path.exists(self._segment_path(segment)):
+                for seq, batch, end in self._scan(segment, offset):
+                    rows.extend(_decode_row(r) for r in batch)
+                    last_seq, offset = seq, end
+                    records += 1
+                    if len(rows) >= max_rows:
+                        return rows, last_seq, (segment, offset), records
+            if segment == active:
+                break
+            segment, offset = segment + 1, 0
+        return rows, last_seq, (segment, offset), records
+
+    def ack(self, last_seq, position, records, rows):
+        """Tandai batch sampai last_seq sudah masuk DB; hapus segmen yang sudah habis"""
+        with self.lock:
+            self.acked_seq = last_seq
+            self.ack_segment, self.ack_offset = position
+            self.pending_records -= records
+            self.pending_rows -= rows
+            self._write_ack()
+            for segment in self._segments():
+                if segment < self.ack_segment and segment != self.active_segment:
+                    os.remove(self._segment_path(segment))
+
+    def stats(self):
+        with self.lock:
+            segments = self._segments()
+            size = sum(os.path.getsize(self._segment_path(s)) for s in segments)
+            return {
+                "pending_records": self.pending_records,
+                "pending_rows": self.pending_rows,
+                "acked_seq": self.acked_seq,
+                "next_seq": self.next_seq,
+                "segments": len(segments),
+                "bytes": size
+            }
+
+    def close(self):
+        with self.lock:
+            self._fh.close()
@@ -0,0 +1,64 @@
+// Klien push stream data sensor (Server-Sent Events dari /stream)
+// Menyimpan keadaan per gedung dan memanggil onUpdate setiap ada frame;
+// bila browser tidak mendukung EventSource atau koneksi putus terlalu lama,
+// fallback ke fungsi polling yang diberikan.
+const LIVE_STREAM_CONFIG = {
+  URL: "/stream",
+  FALLBACK_AFTER_MS: 10000,
+};
+
+function connectLiveStream(options) {
+  const buildings = options.buildings || [];
+  const state = {}; // nama gedung -> { code, summary, sensors }
+  let fallbackTimer = null;
+  let downSince = null;
+
+  function startFallback() {
+    if (fallbackTimer || !options.fallback) return;
+    options.fallback();
+    fallbackTimer = setInterval(options.fallback, options.fallbackInterval || 1000);
+  }
+
+  function stopFallback() {
+    if (fallbackTimer) {
+      clearInterval(fallbackTimer);
+      fallbackTimer = null;
+    }
+  }
+
+  function applyFrame(message, replace) {
+    if (replace) {
+      Object.keys(state).forEach((name) => delete state[name]);
+    }
+    Object.entries(message.buildings || {}).forEach(([name, building]) => {
+      const current = state[name] || { code: building.code, sensors: {} };
+      current.summary = building.summary;
+      Object.assign(current.sensors, building.sensors);
+      state[name] = current;
+    });
+    options.onUpdate(state, message);
+  }
+
+  if (!window.EventSource) {
+    startFallback();
+    return null;
+  }
+
+  const query = buildings.length ? `?buildings=${encodeURIComponent(buildings.join(","))}` : "";
+  const source = new EventSource(LIVE_STREAM_CONFIG.URL + query);
+
+  source.addEventListener("snapshot", (e) => applyFrame(JSON.parse(e.data), true));
+  source.addEventListener("update", (e) => applyFrame(JSON.parse(e.data), false));
+  source.onopen = () => {
+    downSince = null;
+    stopFallback();
+  };
+  source.onerror = () => {
+    // EventSource reconnect otomatis; polling hanya bila putus cukup lama
+    downSince = downSince || Date.now();
+    if (Date.now() - downSince > LIVE_STREAM_CONFIG.FALLBACK_AFTER_MS) {
+      startFallback();
+    }
+  };
+  return source;
+}
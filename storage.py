@@ -0,0 +1,1543 @@
+import csv
+import io
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from pzem_logging import get_logger
+from db_migration import (create_rollup_tables, backfill_rollups, create_readings_partition,
+                          BACKFILL_MIN_DAY, BACKFILL_MAX_DAY)
+from partitions import MonthPartitions, SCHEMA_PREFIX, MONTH_GLOB, month_key, month_start, month_end, schema_name
+
+try:
+    import psycopg2
+    import psycopg2.extras
+    from psycopg2.pool import ThreadedConnectionPool
+except ImportError:  # hanya dibutuhkan oleh backend TimescaleDB
+    psycopg2 = None
+
+log = get_logger("storage")
+
+# Urutan kolom baris yang ditulis ke sensor_readings
+READING_COLUMNS = ('sensor_id', 'timestamp', 'voltage', 'current', 'power', 'energy',
+                   'frequency', 'cost', 'power_factor')
+SENSOR_FIELDS = ('tegangan', 'arus', 'daya', 'energi', 'frekuensi', 'biaya', 'tanggal', 'pf')
+
+# Metric deret waktu /api/readings: (agregasi dalam bucket per sensor, gabungan antar sensor)
+SERIES_METRICS = {
+    "voltage": ("AVG", "AVG"),
+    "current": ("AVG", "AVG"),
+    "power": ("AVG", "SUM"),        # daya gedung = jumlah daya sensor
+    "energy": ("SUM", "SUM"),
+    "frequency": ("AVG", "AVG"),
+    "cost": ("SUM", "SUM"),
+    "power_factor": ("AVG", "AVG")
+}
+
+def series_sql(metric, bucket_expr, sensor_filter, time_filter, source="sensor_readings"):
+    """SQL deret ter-bucket: per sensor dulu, lalu digabung antar sensor per bucket"""
+    inner, outer = SERIES_METRICS[metric]
+    low, high = ("SUM", "SUM") if outer == "SUM" else ("MIN", "MAX")
+    return f"""
+        SELECT bucket, {outer}(value) AS value, {low}(low) AS low, {high}(high) AS high
+        FROM (
+            SELECT {bucket_expr} AS bucket, sensor_id,
+                   {inner}({metric}) AS value, MIN({metric}) AS low, MAX({metric}) AS high
+            FROM {source}
+            WHERE {sensor_filter} AND {time_filter}
+            GROUP BY 1, 2
+        ) AS per_sensor
+        GROUP BY bucket
+        ORDER BY bucket
+    """
+
+# Metric yang bisa dibaca dari rollup: (nilai, min, max) per sensor per bucket atas
+# kolom seragam sensor_id, t, energy, cost, sum_power, samples, avg_power, peak_power
+ROLLUP_SERIES = {
+    "energy": ("SUM(energy)", "SUM(energy)", "SUM(energy)"),
+    "cost": ("SUM(cost)", "SUM(cost)", "SUM(cost)"),
+    "power": ("SUM(sum_power) / NULLIF(SUM(samples), 0)", "MIN(avg_power)", "MAX(peak_power)")
+}
+# bucket minimal yang dilayani dari rollup per jam
+ROLLUP_MIN_BUCKET_SEC = 3600
+
+def rollup_series_sql(metric, bucket_expr, source):
+    """Seperti series_sql tetapi dari rollup (subquery `source` berkolom seragam ROLLUP_SERIES)"""
+    value, low, high = ROLLUP_SERIES[metric]
+    outer = SERIES_METRICS[metric][1]
+    outer_low, outer_high = ("SUM", "SUM") if outer == "SUM" else ("MIN", "MAX")
+    return f"""
+        SELECT bucket, {outer}(value) AS value, {outer_low}(low) AS low, {outer_high}(high) AS high
+        FROM (
+            SELECT {bucket_expr} AS bucket, sensor_id, {value} AS value, {low} AS low, {high} AS high
+            FROM {source} AS rollup
+            GROUP BY 1, 2
+        ) AS per_sensor
+        GROUP BY bucket
+        ORDER BY bucket
+    """
+
+def months_before(dt, months):
+    """Awal bulan `months` bulan sebelum bulan dari dt (batas retensi rollup per jam)"""
+    year, month = divmod(dt.year * 12 + dt.month - 1 - months, 12)
+    return dt.replace(year=year, month=month + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+EPOCH = datetime(1970, 1, 1)
+
+def to_epoch(dt):
+    """Detik epoch dari datetime lokal naif (dibaca sebagai UTC, sama dengan strftime('%s') SQLite)"""
+    return int((dt - EPOCH).total_seconds())
+
+def from_epoch(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+def bucket_floor(dt, bucket_sec):
+    """Awal bucket epoch yang memuat dt"""
+    seconds = to_epoch(dt)
+    return from_epoch(seconds - seconds % bucket_sec)
+
+# Default seeder gedung & sensor (sama dengan db_migration / timescale_migration)
+DEFAULT_BUILDINGS = [
+    ("Departement Pusat", "department1"),
+    ("Departement Mesin", "department2"),
+    ("Departement Elektronika", "department3"),
+    ("Departement Otomotif", "department4"),
+    ("Departement TI", "department5"),
+    ("Departement Manajemen", "department6"),
+    ("Departement Sipil", "department7")
+]
+
+
+class StorageBackend:
+    """
+    Interface storage engine yang dipakai server.
+    Implementasi: SQLiteBackend (pzem.db) dan TimescaleBackend (PostgreSQL).
+    """
+
+    name = "base"
+    # batas data yang masih ada setelah retensi terakhir (None = belum pernah retensi)
+    raw_floor = None
+    hourly_floor = None
+
+    # ------------------------- waktu -------------------------
+    def now(self):
+        """Waktu sekarang dalam zona waktu yang dipakai engine"""
+        raise NotImplementedError
+
+    def format_time(self, dt):
+        """Format datetime untuk response JSON"""
+        raise NotImplementedError
+
+    # ------------------------- tulis -------------------------
+    def write_readings(self, rows):
+        """
+        Tulis banyak baris (urut READING_COLUMNS) dalam satu transaksi; return jumlah baris
+        yang benar-benar baru (baris (sensor_id, timestamp) yang sudah ada tidak dihitung)
+        """
+        raise NotImplementedError
+
+    def bulk_load(self, rows):
+        """
+        Import histori: tulis batch besar baris (urut READING_COLUMNS) dalam satu transaksi,
+        duplikat (sensor_id, timestamp) ditimpa. Rollup tidak diperbarui per baris;
+        panggil rebuild_rollups untuk hari yang terkena. Return jumlah baris yang
+        ditulis (baru atau ditimpa)
+        """
+        raise NotImplementedError
+
+    # ------------------------- baca --------------------------
+    def fetch_topology(self):
+        """Join buildings/sensors: list dict building_id, building_name, building_code, sensor_id, sensor_name"""
+        raise NotImplementedError
+
+    def range_totals(self, sensor_id, start, end):
+        """Total (energy, cost) satu sensor pada rentang [start, end]"""
+        raise NotImplementedError
+
+    def range_totals_by_sensor(self, start, end):
+        """Total {sensor_id: (energy, cost)} semua sensor pada [start, end] dalam satu query"""
+        raise NotImplementedError
+
+    def hourly_totals_by_sensor(self, start, end):
+        """List (sensor_id, awal jam sebagai datetime, energy, cost) pada [start, end]"""
+        raise NotImplementedError
+
+    def hourly_energy(self, sensor_id, limit=60):
+        """List (jam, energy) untuk line chart penggunaan energi"""
+        raise NotImplementedError
+
+    def bucketed_series(self, sensor_ids, metric, start, end, bucket_sec):
+        """
+        List (awal bucket datetime, value, min, max) metric SERIES_METRICS pada [start, end].
+        Bucket >= 1 jam, dan bagian rentang yang lebih tua dari raw_floor, dibaca dari
+        rollup (hourly, atau daily untuk hari sebelum hourly_floor) bila metric tersedia
+        di ROLLUP_SERIES; sisanya dari pembacaan mentah.
+        """
+        if metric not in ROLLUP_SERIES:
+            return self._raw_series(sensor_ids, metric, start, end, bucket_sec)
+        if bucket_sec >= ROLLUP_MIN_BUCKET_SEC:
+            return self._rollup_series(sensor_ids, metric, start, end, bucket_sec)
+        if self.raw_floor is None or start >= self.raw_floor:
+            return self._raw_series(sensor_ids, metric, start, end, bucket_sec)
+        # data mentah sebelum raw_floor sudah dibuang: bagian itu beresolusi per jam
+        split = min(end, self.raw_floor)
+        rows = self._rollup_series(sensor_ids, metric, start, split, ROLLUP_MIN_BUCKET_SEC)
+        if split < end:
+            rows += self._raw_series(sensor_ids, metric, split, end, bucket_sec)
+        return rows
+
+    def _raw_series(self, sensor_ids, metric, start, end, bucket_sec):
+        """bucketed_series dari pembacaan mentah, [start, end] inklusif"""
+        raise NotImplementedError
+
+    def _rollup_series(self, sensor_ids, metric, start, end, bucket_sec):
+        """bucketed_series dari rollup hourly/daily untuk jam/hari yang dimulai di [start, end)"""
+        raise NotImplementedError
+
+    def export_busy(self):
+        """True bila ekspor baru harus ditolak karena semua slot ekspor terpakai"""
+        return False
+
+    def iter_readings(self, sensor_ids, start, end, chunk_rows=5000):
+        """
+        Generator batch baris mentah (urut READING_COLUMNS, timestamp datetime) pada
+        [start, end) urut waktu, paling banyak chunk_rows per batch; tidak pernah
+        memuat seluruh rentang ke memori
+        """
+        raise NotImplementedError
+
+    def seed_if_empty(self, building_data=DEFAULT_BUILDINGS):
+        """Isi gedung & sensor default bila tabel masih kosong (opsional per engine)"""
+        return False
+
+    def apply_retention(self, raw_days, hourly_months):
+        """
+        Terapkan retensi (raw `raw_days` hari, rollup per jam `hourly_months` bulan,
+        harian selamanya); return dict laporan (baris terhapus, ukuran, durasi)
+        """
+        raise NotImplementedError
+
+    def import_history(self, rows, imported_days):
+        """
+        Satu batch import histori; return (baris ditulis, baris ditolak). imported_days
+        = set hari yang sudah diimport sesi ini (diisi engine yang memerlukannya).
+        Default bulk_load; rollup dibangun ulang sekali di akhir dengan rebuild_rollups
+        """
+        return self.bulk_load(rows), 0
+
+    def rebuild_rollups(self, start_day, end_day, sensor_ids=None):
+        """
+        Hitung ulang agregat per jam & harian untuk hari [start_day, end_day) ('YYYY-MM-DD'),
+        opsional hanya untuk sensor_ids; agregat yang data mentahnya sudah dibuang tidak dihapus
+        """
+        raise NotImplementedError
+
+    def migrate_legacy_readings(self):
+        """Pindahkan data format lama ke format baru secara online; return dict laporan atau None"""
+        return None
+
+    def close(self):
+        pass
+
+    # ------------------------ helper -------------------------
+    @staticmethod
+    def split_range(start, end):
+        """
+        Pecah [start, end] menjadi segmen (sumber, dari, sampai, inklusif):
+        'daily' untuk hari penuh, 'hourly' untuk jam penuh, 'raw' untuk sisa di tepi.
+        Hanya segmen raw terakhir yang inklusif di `sampai`.
+        """
+        first_hour = start.replace(minute=0, second=0, microsecond=0)
+        if first_hour < start:
+            first_hour += timedelta(hours=1)
+        last_hour = end.replace(minute=0, second=0, microsecond=0)
+        if first_hour >= last_hour:
+            # kurang dari satu jam penuh: langsung dari data mentah
+            return [("raw", start, end, True)]
+
+        segments = []
+        if start < first_hour:
+            segments.append(("raw", start, first_hour, False))
+
+        first_day = first_hour.replace(hour=0)
+        if first_day < first_hour:
+            first_day += timedelta(days=1)
+        last_day = last_hour.replace(hour=0)
+        if first_day < last_day:
+            if first_hour < first_day:
+                segments.append(("hourly", first_hour, first_day, False))
+            segments.append(("daily", first_day, last_day, False))
+            if last_day < last_hour:
+                segments.append(("hourly", last_day, last_hour, False))
+        else:
+            segments.append(("hourly", first_hour, last_hour, False))
+
+        segments.append(("raw", last_hour, end, True))
+        return segments
+
+    def build_rows(self, items, ts):
+        """Ubah [(sensor_id, data), ...] hasil flush menjadi baris sensor_readings"""
+        rows = []
+        for sensor_id, data in items:
+            if not all(k in data for k in SENSOR_FIELDS):
+                raise ValueError("Data sensor tidak lengkap saat save_sensor_data")
+            rows.append((
+                sensor_id,
+                ts,
+                float(data['tegangan']),
+                float(data['arus']),
+                float(data['daya']),
+                float(data['energi']),
+                float(data['frekuensi']),
+                float(data['biaya']),
+                float(data['pf'])
+            ))
+        return rows
+
+
+# ======================== SQLITE ========================
+class SQLiteBackend(StorageBackend):
+    """
+    SQLite dalam mode WAL: semua tulis lewat satu writer thread dengan koneksi
+    long-lived, baca memakai pool koneksi read-only sehingga dashboard tidak
+    pernah menunggu flush.
+
+    Setiap flush juga meng-UPSERT rollup hourly_energy & daily_energy dalam
+    transaksi yang sama, sehingga query rentang membaca rollup untuk jam/hari
+    penuh dan hanya menyentuh sensor_readings untuk potongan di tepinya.
+
+    Pembacaan mentah ditulis ke tabel readings (ts epoch INTEGER, WITHOUT
+    ROWID, primary key (sensor_id, ts)) di file partisi per bulan
+    (partitions.py) yang di-ATTACH sesuai kebutuhan; query mentah hanya
+    menyentuh partisi yang overlap rentangnya. Konversi datetime <-> epoch
+    hanya di tepi (argumen query & hasil). Tabel format lama (timestamp TEXT:
+    sensor_readings di DB utama / partisi awal) tetap ikut dibaca sampai
+    migrate_legacy_readings memindahkan isinya.
+    Commit lintas file dalam mode WAL tidak atomik: setelah crash, rollup dan
+    partisi bisa berbeda satu flush (perbaiki dengan rebuild_rollups).
+    """
+
+    name = "sqlite"
+    TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    # PRAGMA per koneksi (journal_mode=WAL bersifat persisten, diset oleh writer)
+    PRAGMAS = {
+        "synchronous": "NORMAL",
+        "cache_size": -16000,        # ~16 MB page cache
+        "mmap_size": 268435456,      # 256 MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 30000
+    }
+    READ_POOL_SIZE = 8
+    RETENTION_CHUNK_ROWS = 5000      # baris per transaksi DELETE supaya flush tidak tertahan lama
+    MAX_ATTACHED = 8                 # partisi ter-ATTACH per koneksi (batas SQLite default 10)
+    MIGRATION_CHUNK_ROWS = 5000      # baris format lama per transaksi migrasi
+    EXPORT_WINDOW = timedelta(days=1)  # rentang per query iter_readings
+    LEGACY_READINGS = "main.sensor_readings"
+    # baris tabel lama yang bisa dipindah (timestamp terbaca & bulan valid)
+    LEGACY_VALID = f"(strftime('%s', timestamp) IS NOT NULL AND substr(timestamp, 1, 7) GLOB '{MONTH_GLOB}')"
+
+    # UPSERT rollup; di DO UPDATE kolom tanpa prefix masih bernilai lama
+    HOURLY_UPSERT = """
+        INSERT INTO hourly_energy
+            (sensor_id, hour, total_energy_kWh, total_cost, sum_power, avg_power, peak_power, sample_count)
+        VALUES (?1, ?2, ?3, ?4, ?5, ?5, ?5, 1)
+        ON CONFLICT (sensor_id, hour) DO UPDATE SET
+            total_energy_kWh = total_energy_kWh + excluded.total_energy_kWh,
+            total_cost = total_cost + excluded.total_cost,
+            sum_power = sum_power + excluded.sum_power,
+            avg_power = (sum_power + excluded.sum_power) / (sample_count + 1),
+            peak_power = MAX(peak_power, excluded.peak_power),
+            sample_count = sample_count + 1
+    """
+    DAILY_UPSERT = """
+        INSERT INTO daily_energy
+            (sensor_id, date, total_energy_kWh, total_cost, sum_power, avg_power, peak_power, sample_count)
+        VALUES (?1, ?2, ?3, ?4, ?5, ?5, ?5, 1)
+        ON CONFLICT (sensor_id, date) DO UPDATE SET
+            total_energy_kWh = total_energy_kWh + excluded.total_energy_kWh,
+            total_cost = total_cost + excluded.total_cost,
+            sum_power = sum_power + excluded.sum_power,
+            avg_power = (sum_power + excluded.sum_power) / (sample_count + 1),
+            peak_power = MAX(peak_power, excluded.peak_power),
+            sample_count = sample_count + 1
+    """
+
+    def __init__(self, db_path="pzem.db", partition_dir=None, archive_dir=None):
+        self.db_path = db_path
+        self.partitions = MonthPartitions(partition_dir or os.path.splitext(db_path)[0] + "_partitions",
+                                          archive_dir)
+        self.legacy_partitions = frozenset()   # partisi yang masih punya sensor_readings TEXT
+        self._readers = queue.LifoQueue()
+        self._write_queue = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        # buka koneksi writer (aktifkan WAL) dan pastikan tabel rollup ada sebelum reader pertama
+        try:
+            self.execute_write(self._ensure_rollups)
+            self.execute_write(self._check_partition_formats)
+        except sqlite3.Error as e:
+            log.error("gagal menyiapkan database SQLite path=%s: %s", db_path, e)
+
+    # ---------------------- koneksi ----------------------
+    def _connect(self, read_only=False):
+        if read_only:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True,
+                                   check_same_thread=False, timeout=30)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        for pragma, value in self.PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def get_connection(self):
+        """Koneksi read-write baru (untuk migrasi/tools); server memakai writer thread"""
+        return self._connect()
+
+    def _acquire_reader(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            return self._connect(read_only=True)
+
+    def _release_reader(self, conn):
+        if self._readers.qsize() < self.READ_POOL_SIZE:
+            self._readers.put(conn)
+        else:
+            conn.close()
+
+    def query(self, query, args=(), one=False, partitions=()):
+        """SELECT di koneksi reader; `partitions` = kunci partisi yang perlu di-ATTACH"""
+        conn = self._acquire_reader()
+        try:
+            if partitions:
+                self._attach(conn, partitions)
+            cur = conn.execute(query, args)
+            rows = cur.fetchall()
+        except Exception:
+            conn.close()
+            raise
+        self._release_reader(conn)
+        return (rows[0] if rows else None) if one else rows
+
+    # --------------------- partisi ----------------------
+    def _attach(self, conn, keys, read_only=True):
+        """
+        ATTACH partisi `keys` ke koneksi (harus di luar transaksi). Partisi yang
+        sudah dibuang atau yang terlama di-DETACH bila melewati MAX_ATTACHED.
+        """
+        current = [row[1] for row in conn.execute("PRAGMA database_list")
+                   if row[1].startswith(SCHEMA_PREFIX)]
+        wanted = {schema_name(key): key for key in keys}
+        excess = len(set(current) | set(wanted)) - self.MAX_ATTACHED
+        for schema in current:
+            if schema in wanted:
+                continue
+            if excess > 0 or not self.partitions.exists(schema[len(SCHEMA_PREFIX):]):
+                conn.execute(f"DETACH DATABASE {schema}")
+                excess -= 1
+        for schema, key in wanted.items():
+            if schema in current:
+                continue
+            path = self.partitions.path(key)
+            if read_only:
+                conn.execute(f"ATTACH DATABASE ? AS {schema}", (f"file:{path}?mode=ro",))
+            else:
+                conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+                conn.execute(f"PRAGMA {schema}.synchronous = {self.PRAGMAS['synchronous']}")
+
+    def _prepare_partitions(self, conn, keys):
+        """ATTACH partisi tulis di writer; buat file & tabel untuk bulan yang belum ada"""
+        self._attach(conn, keys, read_only=False)
+        for key in keys:
+            if not self.partitions.exists(key):
+                schema = schema_name(key)
+                conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+                conn.execute(f"PRAGMA {schema}.journal_mode = WAL")
+                create_readings_partition(conn.cursor(), schema)
+                self.partitions.add(key)
+                log.info("partisi baru %s", self.partitions.path(key))
+
+    def _check_partition_formats(self, conn):
+        """Partisi format lama (sensor_readings TEXT): tambah tabel readings; yang sudah kosong dibuang"""
+        legacy = set()
+        for key in self.partitions.keys():
+            schema = schema_name(key)
+            self._attach(conn, [key], read_only=False)
+            if conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'sensor_readings'").fetchone() is None:
+                continue
+            create_readings_partition(conn.cursor(), schema)
+            if conn.execute(f"SELECT 1 FROM {schema}.sensor_readings LIMIT 1").fetchone() is None:
+                conn.execute(f"DROP TABLE {schema}.sensor_readings")
+            else:
+                legacy.add(key)
+        self.legacy_partitions = frozenset(legacy)
+
+    def _reading_sources(self, keys):
+        """
+        Tabel pembacaan yang dibaca untuk partisi `keys`: list (tabel, kolom waktu),
+        'timestamp' untuk format lama (TEXT), 'ts' untuk readings (epoch)
+        """
+        legacy = self.legacy_partitions
+        sources = [(self.LEGACY_READINGS, "timestamp")]
+        for key in keys:
+            sources.append((f"{schema_name(key)}.readings", "ts"))
+            if key in legacy:
+                sources.append((f"{schema_name(key)}.sensor_readings", "timestamp"))
+        return sources
+
+    def _time_arg(self, column, dt):
+        """Argumen waktu sesuai format kolom tabel pembacaan"""
+        return to_epoch(dt) if column == "ts" else self.format_time(dt)
+
+    # ---------------------- writer -----------------------
+    def _writer_loop(self):
+        conn = None
+        while True:
+            job = self._write_queue.get()
+            if job is None:
+                break
+            fn, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    conn.execute("PRAGMA journal_mode = WAL")
+                with conn:
+                    result = fn(conn)
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+        if conn is not None:
+            conn.close()
+
+    def _ensure_rollups(self, conn):
+        cur = conn.cursor()
+        if create_rollup_tables(cur):
+            # DB lama tanpa rollup: isi dari histori yang sudah ada
+            rows = backfill_rollups(cur)
+            log.info("tabel rollup dibuat dan di-backfill hourly_rows=%d", rows)
+
+    def submit_write(self, fn):
+        """Jalankan fn(conn) di writer thread dalam satu transaksi; return Future"""
+        future = Future()
+        self._write_queue.put((fn, future))
+        return future
+
+    def execute_write(self, fn, timeout=None):
+        """Seperti submit_write tetapi menunggu hasilnya"""
+        return self.submit_write(fn).result(timeout)
+
+    def now(self):
+        return datetime.now()
+
+    def format_time(self, dt):
+        return dt.strftime(self.TIME_FORMAT)
+
+    def write_readings(self, rows):
+        if not rows:
+            return 0
+        months = sorted({month_key(row[1]) for row in rows})
+        if len(months) > self.MAX_ATTACHED:
+            # backlog spool sangat panjang: tulis per kelompok bulan
+            return sum(
+                self.write_readings([row for row in rows if month_key(row[1]) in group])
+                for group in (set(months[i:i + self.MAX_ATTACHED])
+                              for i in range(0, len(months), self.MAX_ATTACHED))
+            )
+        rows = [
+            (sensor_id, ts if isinstance(ts, datetime) else datetime.strptime(ts, self.TIME_FORMAT),
+             round(v, 3), round(i, 3), round(p, 3), round(e, 7), round(f, 3), cost, round(pf, 3))
+            for sensor_id, ts, v, i, p, e, f, cost, pf in rows
+        ]
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(month_key(row[1]), []).append(row)
+
+        def insert(conn):
+            self._prepare_partitions(conn, months)
+            # OR IGNORE: baris (sensor_id, ts) yang sudah ada (replay spool ganda)
+            # dilewati dan tidak ikut dijumlahkan ke rollup
+            inserted = []
+            for key, month_rows in by_month.items():
+                sql = f"""
+                    INSERT OR IGNORE INTO {schema_name(key)}.readings
+                    (sensor_id, ts, voltage, current, power, energy, frequency, cost, power_factor)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """
+                for row in month_rows:
+                    if conn.execute(sql, (row[0], to_epoch(row[1]), *row[2:])).rowcount:
+                        inserted.append(row)
+
+            # (sensor_id, awal jam, energy, cost, power) dan versi hariannya untuk rollup
+            hourly = [(r[0], r[1].strftime("%Y-%m-%d %H:00:00"), r[5], r[7], r[4]) for r in inserted]
+            daily = [(sensor_id, hour[:10], e, c, p) for sensor_id, hour, e, c, p in hourly]
+            conn.executemany(self.HOURLY_UPSERT, hourly)
+            conn.executemany(self.DAILY_UPSERT, daily)
+            return len(inserted)
+
+        return self.execute_write(insert)
+
+    def bulk_load(self, rows):
+        if not rows:
+            return 0
+        by_month = {}
+        for sensor_id, ts, *values in rows:
+            by_month.setdefault(month_key(ts), []).append((sensor_id, to_epoch(ts), *values))
+        months = sorted(by_month)
+
+        def load(conn, keys):
+            self._prepare_partitions(conn, keys)
+            for key in keys:
+                # executemany tanpa upsert rollup per baris: rollup dibangun ulang sekali di akhir import
+                conn.executemany(f"""
+                    INSERT INTO {schema_name(key)}.readings
+                    (sensor_id, ts, voltage, current, power, energy, frequency, cost, power_factor)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (sensor_id, ts) DO UPDATE
+                      SET voltage = excluded.voltage,
+                          current = excluded.current,
+                          power = excluded.power,
+                          energy = excluded.energy,
+                          frequency = excluded.frequency,
+                          cost = excluded.cost,
+                          power_factor = excluded.power_factor
+                """, by_month[key])
+            return sum(len(by_month[key]) for key in keys)
+
+        return sum(
+            self.execute_write(lambda conn: load(conn, group))
+            for group in (months[i:i + self.MAX_ATTACHED] for i in range(0, len(months), self.MAX_ATTACHED))
+        )
+
+    def fetch_topology(self):
+        return self.query("""
+            SELECT b.id as building_id, b.name as building_name, b.code as building_code,
+                   s.id as sensor_id, s.name as sensor_name
+            FROM buildings b
+            LEFT JOIN sensors s ON b.id = s.building_id
+            ORDER BY b.id
+        """)
+
+    # sub-query per sumber split_range, berkolom sensor_id, energy, cost
+    # (raw: satu sub-query per tabel pembacaan yang overlap, {column} timestamp/ts)
+    RANGE_SOURCES = {
+        "raw": "SELECT sensor_id, energy, cost FROM {table} WHERE {column} >= ? AND {column} {op} ?",
+        "hourly": ("SELECT sensor_id, total_energy_kWh AS energy, total_cost AS cost FROM hourly_energy "
+                   "WHERE hour >= ? AND hour {op} ?"),
+        "daily": ("SELECT sensor_id, total_energy_kWh AS energy, total_cost AS cost FROM daily_energy "
+                  "WHERE date >= ? AND date {op} ?")
+    }
+
+    def _range_query(self, start, end, sensor_filter="", filter_args=()):
+        """Total per sensor pada [start, end]: hari/jam penuh dari rollup, tepi dari sensor_readings"""
+        parts, args, keys = [], [], []
+        for source, lo, hi, inclusive in self.split_range(start, end):
+            op = "<=" if inclusive else "<"
+            if source == "raw":
+                overlapping = self.partitions.overlapping(lo, hi)
+                keys += overlapping
+                for table, column in self._reading_sources(overlapping):
+                    parts.append(self.RANGE_SOURCES["raw"].format(table=table, column=column, op=op) + sensor_filter)
+                    args += [self._time_arg(column, lo), self._time_arg(column, hi), *filter_args]
+                continue
+            parts.append(self.RANGE_SOURCES[source].format(op=op) + sensor_filter)
+            if source == "daily":
+                args += [lo.strftime("%Y-%m-%d"), hi.strftime("%Y-%m-%d")]
+            else:
+                args += [self.format_time(lo), self.format_time(hi)]
+            args += filter_args
+        union = " UNION ALL ".join(parts)
+        return self.query(f"""
+            SELECT sensor_id, SUM(energy) as energy, SUM(cost) as cost
+            FROM ({union})
+            GROUP BY sensor_id
+        """, args, partitions=sorted(set(keys)))
+
+    def range_totals(self, sensor_id, start, end):
+        rows = self._range_query(start, end, " AND sensor_id = ?", (sensor_id,))
+        if not rows:
+            return 0.0, 0.0
+        return rows[0]["energy"] or 0.0, rows[0]["cost"] or 0.0
+
+    def range_totals_by_sensor(self, start, end):
+        rows = self._range_query(start, end)
+        return {row["sensor_id"]: (row["energy"] or 0.0, row["cost"] or 0.0) for row in rows}
+
+    def hourly_totals_by_sensor(self, start, end):
+        rows = self.query("""
+            SELECT sensor_id, hour, total_energy_kWh as energy, total_cost as cost
+            FROM hourly_energy
+            WHERE hour >= ? AND hour <= ?
+        """, (self.format_time(start.replace(minute=0, second=0, microsecond=0)), self.format_time(end)))
+        return [
+            (row["sensor_id"], datetime.strptime(row["hour"], self.TIME_FORMAT),
+             row["energy"] or 0.0, row["cost"] or 0.0)
+            for row in rows
+        ]
+
+    def hourly_energy(self, sensor_id, limit=60):
+        # sama dengan versi TimescaleDB: total energi per jam-dalam-hari
+        rows = self.query("""
+            SELECT strftime('%H', hour) as jam, SUM(total_energy_kWh) as energy
+            FROM hourly_energy
+            WHERE sensor_id = ?
+            GROUP BY jam
+            ORDER BY jam ASC
+            LIMIT ?
+        """, (sensor_id, limit))
+        return [(row["jam"], row["energy"] or 0.0) for row in rows]
+
+    def _series_rows(self, sensor_ids, metric, start, end, inclusive, bucket_sec):
+        keys = self.partitions.overlapping(start, end)
+        op = "<=" if inclusive else "<"
+        branches, args = [], []
+        for table, column in self._reading_sources(keys):
+            if column == "ts":
+                # filter ts luar di-push down ke primary key (sensor_id, ts)
+                branches.append(f"SELECT sensor_id, ts, {metric} FROM {table}")
+            else:
+                # format lama: filter TEXT sendiri supaya index idx_sensor_time terpakai
+                branches.append(f"SELECT sensor_id, CAST(strftime('%s', timestamp) AS INTEGER) AS ts, {metric} "
+                                f"FROM {table} WHERE timestamp >= ? AND timestamp {op} ?")
+                args += [self.format_time(start), self.format_time(end)]
+        placeholders = ", ".join("?" for _ in sensor_ids)
+        return self.query(series_sql(
+            metric,
+            f"(ts / {bucket_sec}) * {bucket_sec}",
+            f"sensor_id IN ({placeholders})",
+            f"ts >= ? AND ts {op} ?",
+            "(" + " UNION ALL ".join(branches) + ")"
+        ), (*args, *sensor_ids, to_epoch(start), to_epoch(end)), partitions=keys)
+
+    def _rollup_series(self, sensor_ids, metric, start, end, bucket_sec):
+        placeholders = ", ".join("?" for _ in sensor_ids)
+        hour_start = self.format_time(start.replace(minute=0, second=0, microsecond=0))
+        hourly_floor = self.format_time(self.hourly_floor) if self.hourly_floor is not None else None
+        branches = [f"""
+            SELECT sensor_id, CAST(strftime('%s', hour) AS INTEGER) AS t, total_energy_kWh AS energy,
+                   total_cost AS cost, sum_power, sample_count AS samples, avg_power, peak_power
+            FROM hourly_energy
+            WHERE sensor_id IN ({placeholders}) AND hour >= ? AND hour < ?
+        """]
+        args = [*sensor_ids, max(hour_start, hourly_floor or hour_start), self.format_time(end)]
+        if hourly_floor is not None and hour_start < hourly_floor:
+            # hourly sudah dibuang retensi: hari sebelum hourly_floor dari daily_energy
+            branches.append(f"""
+                SELECT sensor_id, CAST(strftime('%s', date) AS INTEGER) AS t, total_energy_kWh AS energy,
+                       total_cost AS cost, sum_power, sample_count AS samples, avg_power, peak_power
+                FROM daily_energy
+                WHERE sensor_id IN ({placeholders}) AND date >= ? AND date < ?
+            """)
+            args += [*sensor_ids, start.strftime("%Y-%m-%d"), min(hourly_floor, self.format_time(end))[:10]]
+        bucket_sec = int(bucket_sec)
+        rows = self.query(rollup_series_sql(
+            metric, f"(t / {bucket_sec}) * {bucket_sec}", "(" + " UNION ALL ".join(branches) + ")"
+        ), args)
+        return [
+            (from_epoch(row["bucket"]), row["value"] or 0.0, row["low"] or 0.0, row["high"] or 0.0)
+            for row in rows
+        ]
+
+    def _raw_series(self, sensor_ids, metric, start, end, bucket_sec):
+        bucket_sec = int(bucket_sec)
+        rows = []
+        keys = self.partitions.overlapping(start, end)
+        while len(keys) > self.MAX_ATTACHED:
+            # terlalu banyak partisi untuk satu query: potong di awal bucket
+            # sebelum partisi ke-MAX_ATTACHED supaya tidak ada bucket terbagi dua
+            split = bucket_floor(month_start(keys[self.MAX_ATTACHED - 1]), bucket_sec)
+            if split <= start:
+                break
+            rows += self._series_rows(sensor_ids, metric, start, split, False, bucket_sec)
+            start = split
+            keys = self.partitions.overlapping(start, end)
+        rows += self._series_rows(sensor_ids, metric, start, end, True, bucket_sec)
+        return [
+            (from_epoch(row["bucket"]),
+             row["value"] or 0.0, row["low"] or 0.0, row["high"] or 0.0)
+            for row in rows
+        ]
+
+    def iter_readings(self, sensor_ids, start, end, chunk_rows=5000):
+        # per jendela EXPORT_WINDOW: ORDER BY hanya mengurutkan satu jendela kecil
+        placeholders = ", ".join("?" for _ in sensor_ids)
+        lo = start
+        while lo < end:
+            hi = min(end, lo + self.EXPORT_WINDOW)
+            keys = self.partitions.overlapping(lo, hi)
+            branches, args = [], []
+            for table, column in self._reading_sources(keys):
+                ts = "ts" if column == "ts" else "CAST(strftime('%s', timestamp) AS INTEGER)"
+                branches.append(f"""
+                    SELECT sensor_id, {ts} AS ts, voltage, current, power, energy, frequency, cost, power_factor
+                    FROM {table} WHERE sensor_id IN ({placeholders}) AND {column} >= ? AND {column} < ?
+                """)
+                args += [*sensor_ids, self._time_arg(column, lo), self._time_arg(column, hi)]
+
+            conn = self._acquire_reader()
+            try:
+                self._attach(conn, keys)
+                cur = conn.execute(" UNION ALL ".join(branches) + " ORDER BY ts, sensor_id", args)
+                while True:
+                    rows = cur.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    yield [(row[0], from_epoch(row[1]), *row[2:]) for row in rows]
+            except BaseException:
+                # termasuk GeneratorExit saat klien putus: jangan kembalikan cursor setengah jalan ke pool
+                conn.close()
+                raise
+            self._release_reader(conn)
+            lo = hi
+
+    def _space_stats(self):
+        row = self.query("""
+            SELECT (SELECT page_count FROM pragma_page_count) AS pages,
+                   (SELECT freelist_count FROM pragma_freelist_count) AS free_pages,
+                   (SELECT page_size FROM pragma_page_size) AS page_size,
+                   (SELECT auto_vacuum FROM pragma_auto_vacuum) AS auto_vacuum
+        """, one=True)
+        size = sum(os.path.getsize(path) for path in (self.db_path, self.db_path + "-wal")
+                   if os.path.exists(path)) + self.partitions.total_bytes()
+        return {"file_bytes": size, "pages": row["pages"], "free_pages": row["free_pages"],
+                "page_size": row["page_size"], "auto_vacuum": row["auto_vacuum"]}
+
+    def _delete_before(self, table, column, cutoff, sensor_ids, partition=None):
+        """
+        DELETE bertahap per sensor (memakai key/index sensor_id + waktu, tabel
+        readings tidak punya rowid), satu chunk per transaksi
+        """
+        def delete(conn, sensor_id):
+            if partition:
+                self._attach(conn, [partition], read_only=False)
+            return conn.execute(f"""
+                DELETE FROM {table} WHERE sensor_id = ?1 AND {column} IN (
+                    SELECT {column} FROM {table} WHERE sensor_id = ?1 AND {column} < ?2 LIMIT ?3
+                )
+            """, (sensor_id, cutoff, self.RETENTION_CHUNK_ROWS)).rowcount
+
+        deleted = 0
+        for sensor_id in sensor_ids:
+            while True:
+                count = self.execute_write(lambda conn: delete(conn, sensor_id))
+                deleted += count
+                if count < self.RETENTION_CHUNK_ROWS:
+                    break
+        return deleted
+
+    def _drop_partition(self, key):
+        """Checkpoint & DETACH partisi dari writer, lalu hapus/arsip filenya"""
+        def detach(conn):
+            self._attach(conn, [key], read_only=False)
+            conn.execute(f"PRAGMA {schema_name(key)}.wal_checkpoint(TRUNCATE)").fetchall()
+            conn.execute(f"DETACH DATABASE {schema_name(key)}")
+
+        self.execute_write(detach)
+        return self.partitions.remove(key)
+
+    def _vacuum_partition(self, conn, key):
+        self._attach(conn, [key], read_only=False)
+        conn.executescript(f"PRAGMA {schema_name(key)}.incremental_vacuum")
+
+    def apply_retention(self, raw_days, hourly_months):
+        started = time.monotonic()
+        now = self.now()
+        # cutoff raw di awal hari: jam & hari yang tersisa selalu utuh, jadi
+        # rebuild rollup dari data mentah tidak pernah menghasilkan total parsial
+        raw_cutoff_dt = (now - timedelta(days=raw_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        raw_cutoff = self.format_time(raw_cutoff_dt)
+        hourly_cutoff = self.format_time(months_before(now, hourly_months))
+        before = self._space_stats()
+        sensor_ids = [row["sensor_id"] for row in self.query(
+            "SELECT DISTINCT sensor_id FROM hourly_energy UNION SELECT id FROM sensors")]
+
+        # bulan yang seluruhnya kadaluarsa: buang file utuh tanpa DELETE
+        dropped = self.partitions.expired(raw_cutoff_dt)
+        for key in dropped:
+            self._drop_partition(key)
+        if dropped:
+            # reader idle mungkin masih meng-ATTACH file yang dibuang
+            while not self._readers.empty():
+                self._readers.get_nowait().close()
+
+        # bulan yang memuat cutoff (dan tabel format lama): DELETE bertahap
+        edge = month_key(raw_cutoff_dt)
+        edge_keys = [edge] if self.partitions.exists(edge) else []
+        deleted_raw = deleted_edge = 0
+        for table, column in self._reading_sources(edge_keys):
+            count = self._delete_before(table, column, self._time_arg(column, raw_cutoff_dt), sensor_ids,
+                                        partition=None if table == self.LEGACY_READINGS else edge)
+            deleted_raw += count
+            if table != self.LEGACY_READINGS:
+                deleted_edge += count
+        if deleted_edge:
+            self.execute_write(lambda conn: self._vacuum_partition(conn, edge))
+        deleted_hourly = self._delete_before("hourly_energy", "hour", hourly_cutoff, sensor_ids)
+
+        if before["auto_vacuum"] == 2:
+            # kembalikan halaman kosong ke filesystem lalu kecilkan WAL; executescript
+            # menjalankan pragma sampai selesai (execute() hanya membebaskan satu halaman)
+            self.execute_write(lambda conn: conn.executescript("PRAGMA incremental_vacuum"))
+        elif deleted_raw or deleted_hourly:
+            log.warning("auto_vacuum bukan INCREMENTAL: halaman kosong hanya dipakai ulang, file tidak mengecil "
+                        "(jalankan 'python db_migration.py enable-incremental-vacuum' saat server mati)")
+        self.execute_write(lambda conn: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall())
+        after = self._space_stats()
+        self.raw_floor, self.hourly_floor = raw_cutoff_dt, months_before(now, hourly_months)
+
+        return {
+            "raw_cutoff": raw_cutoff,
+            "hourly_cutoff": hourly_cutoff,
+            "deleted_raw": deleted_raw,
+            "deleted_hourly": deleted_hourly,
+            "dropped_partitions": dropped,
+            "archive_dir": self.partitions.archive_dir,
+            "bytes_before": before["file_bytes"],
+            "bytes_after": after["file_bytes"],
+            "reclaimed_bytes": before["file_bytes"] - after["file_bytes"],
+            "free_pages": after["free_pages"],
+            "seconds": round(time.monotonic() - started, 3)
+        }
+
+    def _rollup_windows(self, start_day, end_day):
+        """Potong [start_day, end_day) per bulan partisi: (dari, sampai, [kunci partisi])"""
+        windows, cursor = [], start_day
+        for key in self.partitions.keys():
+            lo = max(cursor, month_start(key).strftime("%Y-%m-%d"))
+            hi = min(end_day, month_end(key).strftime("%Y-%m-%d"))
+            if lo >= hi:
+                continue
+            if cursor < lo:
+                windows.append((cursor, lo, []))
+            windows.append((lo, hi, [key]))
+            cursor = hi
+        if cursor < end_day:
+            windows.append((cursor, end_day, []))
+        return windows
+
+    def rebuild_rollups(self, start_day=BACKFILL_MIN_DAY, end_day=BACKFILL_MAX_DAY, sensor_ids=None):
+        """Bangun ulang rollup dari sensor_readings (DB utama + partisi) untuk hari [start_day, end_day) ('YYYY-MM-DD')"""
+        def rebuild(conn, lo, hi, keys):
+            self._attach(conn, keys, read_only=False)
+            return backfill_rollups(conn.cursor(), lo, hi, self._reading_sources(keys), sensor_ids)
+
+        return sum(
+            self.execute_write(lambda conn: rebuild(conn, lo, hi, keys))
+            for lo, hi, keys in self._rollup_windows(start_day, end_day)
+        )
+
+    def _migrate_chunk(self, conn, table, source_key):
+        """
+        Satu chunk (urut rowid) tabel format lama -> readings partisi bulannya;
+        INSERT & DELETE dalam satu transaksi writer. Return (dipindah, invalid, dihapus)
+        """
+        if source_key:
+            self._attach(conn, [source_key], read_only=False)
+        lo, hi = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM (SELECT rowid FROM {table} ORDER BY rowid LIMIT ?)",
+                              (self.MIGRATION_CHUNK_ROWS,)).fetchone()
+        if lo is None:
+            return 0, 0, 0
+        # paling banyak MAX_ATTACHED - 1 bulan per chunk; sisanya diambil chunk berikutnya
+        months = [row[0] for row in conn.execute(f"""
+            SELECT DISTINCT substr(timestamp, 1, 7) FROM {table}
+            WHERE rowid BETWEEN ? AND ? AND {self.LEGACY_VALID} ORDER BY 1 LIMIT ?
+        """, (lo, hi, self.MAX_ATTACHED - 1))]
+        invalid = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE rowid BETWEEN ? AND ? AND NOT {self.LEGACY_VALID}",
+                               (lo, hi)).fetchone()[0]
+        self._prepare_partitions(conn, [month_key(month) for month in months])
+
+        moved = 0
+        for month in months:
+            moved += conn.execute(f"""
+                INSERT OR IGNORE INTO {schema_name(month_key(month))}.readings
+                (sensor_id, ts, voltage, current, power, energy, frequency, cost, power_factor)
+                SELECT sensor_id, CAST(strftime('%s', timestamp) AS INTEGER),
+                       voltage, current, power, energy, frequency, cost, power_factor
+                FROM {table}
+                WHERE rowid BETWEEN ? AND ? AND substr(timestamp, 1, 7) = ? AND {self.LEGACY_VALID}
+            """, (lo, hi, month)).rowcount
+        in_months = " OR substr(timestamp, 1, 7) IN ({})".format(", ".join("?" for _ in months)) if months else ""
+        deleted = conn.execute(f"DELETE FROM {table} WHERE rowid BETWEEN ? AND ? AND (NOT {self.LEGACY_VALID}{in_months})",
+                               (lo, hi, *months)).rowcount
+        return moved, invalid, deleted
+
+    def migrate_legacy_readings(self):
+        """
+        Migrasi online sensor_readings format lama (timestamp TEXT, rowid) ke
+        readings partisi (epoch, WITHOUT ROWID) per chunk lewat writer thread,
+        sehingga flush tetap berjalan di sela chunk dan setiap baris selalu ada
+        di tepat satu tabel yang dibaca query. Aman dihentikan dan diulang.
+        """
+        started = time.monotonic()
+        report = {"moved": 0, "invalid": 0, "duplicates": 0}
+        legacy = [(self.LEGACY_READINGS, None)] + [
+            (f"{schema_name(key)}.sensor_readings", key) for key in sorted(self.legacy_partitions)]
+        for table, key in legacy:
+            while True:
+                moved, invalid, deleted = self.execute_write(lambda conn: self._migrate_chunk(conn, table, key))
+                if not deleted:
+                    break
+                report["moved"] += moved
+                report["invalid"] += invalid
+                report["duplicates"] += deleted - moved - invalid
+            if key:
+                self.legacy_partitions = self.legacy_partitions - {key}
+                self.execute_write(lambda conn: self._vacuum_partition(conn, key))
+        if report["moved"] and self._space_stats()["auto_vacuum"] == 2:
+            self.execute_write(lambda conn: conn.executescript("PRAGMA incremental_vacuum"))
+        report["seconds"] = round(time.monotonic() - started, 3)
+        return report
+
+    def close(self):
+        self._write_queue.put(None)
+        self._writer.join()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+
+# ====================== TIMESCALEDB ======================
+class TimescaleBackend(StorageBackend):
+    """
+    TimescaleDB: query rentang membaca continuous aggregate hourly_energy /
+    daily_energy (real-time aggregation, jadi tail yang belum termaterialisasi
+    ikut dihitung dari hypertable) dan hanya potongan tepi dari sensor_readings.
+    Bila aggregate belum dibuat (timescale_migration belum dijalankan), semua
+    query jatuh ke hypertable mentah.
+    """
+
+    name = "timescale"
+
+    # sub-query per sumber split_range, berkolom sensor_id, energy, cost
+    RANGE_SOURCES = {
+        "raw": ("SELECT sensor_id, energy, cost FROM sensor_readings "
+                "WHERE timestamp >= %s AND timestamp {op} %s"),
+        "hourly": ("SELECT sensor_id, total_energy_kwh AS energy, total_cost AS cost FROM hourly_energy "
+                   "WHERE hour >= %s AND hour {op} %s"),
+        "daily": ("SELECT sensor_id, total_energy_kwh AS energy, total_cost AS cost FROM daily_energy "
+                  "WHERE date >= %s AND date {op} %s")
+    }
+
+    EXPORT_WAIT_SEC = 30  # antre slot ekspor paling lama ini sebelum stream dibatalkan
+    IMPORT_REFRESH_MARGIN = timedelta(days=1)  # import_history: hari sedekat ini ke batas retensi di-refresh per batch
+
+    def __init__(self, db_config, minconn=1, maxconn=10, export_maxconn=2):
+        if psycopg2 is None:
+            raise RuntimeError("psycopg2 belum terpasang: pip install psycopg2-binary")
+        self.db_config = db_config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.pool = None
+        self.write_lock = threading.Lock()
+        # koneksi ekspor di luar pool, dibatasi export_maxconn sekaligus
+        self.export_maxconn = export_maxconn
+        self.export_slots = threading.BoundedSemaphore(export_maxconn)
+        self.export_lock = threading.Lock()
+        self.export_active = 0
+        self.aggregates = None             # set nama continuous aggregate yang tersedia
+
+    def init_pool(self):
+        if self.pool is None:
+            self.pool = ThreadedConnectionPool(self.minconn, self.maxconn, **self.db_config)
+
+    def get_conn(self):
+        """Get connection from pool; caller must put it back via put_conn."""
+        if self.pool is None:
+            self.init_pool()
+        return self.pool.getconn()
+
+    def put_conn(self, conn):
+        if self.pool:
+            self.pool.putconn(conn)
+
+    def query(self, query, args=(), one=False):
+        """
+        Run SELECT query and return rows as list of dicts (RealDictCursor).
+        """
+        conn = self.get_conn()
+        try:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.execute(query, args)
+            rows = cur.fetchall()
+            cur.close()
+            conn.commit()
+            return (rows[0] if rows else None) if one else rows
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.put_conn(conn)
+
+    def execute(self, query, args=()):
+        """
+        Run INSERT/UPDATE/DDL. Uses connection commit.
+        """
+        conn = self.get_conn()
+        try:
+            cur = conn.cursor()
+            cur.execute(query, args)
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.put_conn(conn)
+
+    def now(self):
+        # Use UTC timestamp; sensor timestamp field in DB is TIMESTAMPTZ
+        return datetime.now(timezone.utc)
+
+    def format_time(self, dt):
+        return dt.isoformat()
+
+    def write_readings(self, rows):
+        if not rows:
+            return 0
+        # execute_values (bukan COPY) karena butuh ON CONFLICT untuk upsert.
+        # xmax = 0 hanya untuk baris hasil INSERT, bukan yang di-UPDATE oleh ON CONFLICT:
+        # replay spool setelah crash (commit DB sebelum ack) tidak dihitung dua kali
+        with self.write_lock:
+            conn = self.get_conn()
+            try:
+                cur = conn.cursor()
+                inserted = psycopg2.extras.execute_values(cur, """
+                    INSERT INTO sensor_readings
+                    (sensor_id, timestamp, voltage, current, power, energy, frequency, cost, power_factor)
+                    VALUES %s
+                    ON CONFLICT (sensor_id, timestamp) DO UPDATE
+                      SET voltage = EXCLUDED.voltage,
+                          current = EXCLUDED.current,
+                          power = EXCLUDED.power,
+                          energy = EXCLUDED.energy,
+                          frequency = EXCLUDED.frequency,
+                          cost = EXCLUDED.cost,
+                          power_factor = EXCLUDED.power_factor
+                    RETURNING (xmax = 0)
+                """, rows, page_size=500, fetch=True)
+                conn.commit()
+                cur.close()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self.put_conn(conn)
+        return sum(1 for (is_new,) in inserted if is_new)
+
+    def bulk_load(self, rows):
+        if not rows:
+            return 0
+        # COPY tidak mendukung ON CONFLICT: COPY ke tabel staging sementara lalu
+        # satu INSERT ... SELECT upsert ke hypertable
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerows((sensor_id, ts.isoformat(), *values) for sensor_id, ts, *values in rows)
+        buffer.seek(0)
+        with self.write_lock:
+            conn = self.get_conn()
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS import_readings
+                    (LIKE sensor_readings INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+                """)
+                cur.copy_expert("""
+                    COPY import_readings
+                    (sensor_id, timestamp, voltage, current, power, energy, frequency, cost, power_factor)
+                    FROM STDIN WITH (FORMAT csv)
+                """, buffer)
+                # DISTINCT ON: duplikat di dalam satu batch tidak boleh di-upsert dua kali
+                cur.execute("""
+                    INSERT INTO sensor_readings
+                    (sensor_id, timestamp, voltage, current, power, energy, frequency, cost, power_factor)
+                    SELECT DISTINCT ON (sensor_id, timestamp)
+                           sensor_id, timestamp, voltage, current, power, energy, frequency, cost, power_factor
+                    FROM import_readings
+                    ORDER BY sensor_id, timestamp
+                    ON CONFLICT (sensor_id, timestamp) DO UPDATE
+                      SET voltage = EXCLUDED.voltage,
+                          current = EXCLUDED.current,
+                          power = EXCLUDED.power,
+                          energy = EXCLUDED.energy,
+                          frequency = EXCLUDED.frequency,
+                          cost = EXCLUDED.cost,
+                          power_factor = EXCLUDED.power_factor
+                """)
+                written = cur.rowcount
+                conn.commit()
+                cur.close()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self.put_conn(conn)
+        return written
+
+    def _raw_retention_floor(self):
+        """Awal hari UTC pertama yang pasti tidak tersentuh policy retensi sensor_readings (None = tanpa retensi)"""
+        row = self.query("""
+            SELECT (config->>'drop_after')::interval AS drop_after FROM timescaledb_information.jobs
+            WHERE proc_name = 'policy_retention' AND hypertable_name = 'sensor_readings'
+        """, one=True)
+        if not row or row["drop_after"] is None:
+            return None
+        floor = self.now() - row["drop_after"]
+        return (floor + timedelta(days=1)).date()
+
+    def _refresh_aggregates(self, windows):
+        """Refresh kedua continuous aggregate untuk setiap jendela hari UTC [lo, hi)"""
+        conn = self.get_conn()
+        # refresh_continuous_aggregate tidak boleh berjalan di dalam blok transaksi
+        conn.autocommit = True
+        try:
+            cur = conn.cursor()
+            for lo, hi in windows:
+                for view in ("hourly_energy", "daily_energy"):
+                    cur.execute("CALL refresh_continuous_aggregate(%s, %s, %s)", (
+                        view,
+                        datetime.combine(lo, datetime.min.time(), timezone.utc),
+                        datetime.combine(hi, datetime.min.time(), timezone.utc)
+                    ))
+            cur.close()
+        finally:
+            conn.autocommit = False
+            self.put_conn(conn)
+
+    def import_history(self, rows, imported_days):
+        """
+        Hari (UTC) di bawah batas policy retensi raw (+ IMPORT_REFRESH_MARGIN) langsung
+        di-refresh ke aggregate setelah bulk_load, sebelum retensi sempat membuang
+        barisnya. Hari di bawah batas retensi yang sudah punya bucket daily_energy dan
+        belum diimport sesi ini ditolak: sisa data mentah hari itu mungkin sudah dibuang,
+        refresh akan menimpa bucket yang lengkap dengan sebagian data saja.
+        """
+        floor = self._raw_retention_floor() if self.has_aggregates() else None
+        if floor is None:
+            return self.bulk_load(rows), 0
+        day_of = lambda ts: ts.astimezone(timezone.utc).date()
+        old_days = {day for day in {day_of(row[1]) for row in rows}
+                    if day < floor + self.IMPORT_REFRESH_MARGIN}
+        if not old_days:
+            return self.bulk_load(rows), 0
+
+        candidates = sorted(day for day in old_days if day < floor and day not in imported_days)
+        rejected_days = set()
+        if candidates:
+            existing = self.query("""
+                SELECT DISTINCT (date AT TIME ZONE 'UTC')::date AS day FROM daily_energy
+                WHERE date >= %s AND date < %s
+            """, (datetime.combine(candidates[0], datetime.min.time(), timezone.utc),
+                  datetime.combine(candidates[-1] + timedelta(days=1), datetime.min.time(), timezone.utc)))
+            rejected_days = {row["day"] for row in existing} & set(candidates)
+        kept = rows
+        if rejected_days:
+            log.warning("import %d hari sebelum batas retensi %s ditolak: daily_energy hari itu sudah ada",
+                        len(rejected_days), floor)
+            kept = [row for row in rows if day_of(row[1]) not in rejected_days]
+        written = self.bulk_load(kept)
+
+        # refresh per rentang hari berurutan, tepat di batas hari UTC
+        windows = []
+        for day in sorted(old_days - rejected_days):
+            if windows and windows[-1][1] == day:
+                windows[-1][1] = day + timedelta(days=1)
+            else:
+                windows.append([day, day + timedelta(days=1)])
+        self._refresh_aggregates(windows)
+        imported_days.update(old_days - rejected_days)
+        return written, len(rows) - len(kept)
+
+    def rebuild_rollups(self, start_day, end_day, sensor_ids=None):
+        """
+        Refresh continuous aggregate untuk hari [start_day, end_day); return jumlah aggregate.
+        Refresh tidak bisa dibatasi per sensor (sensor_ids diabaikan) dan menghapus bucket
+        yang data mentahnya sudah dibuang, jadi jendela dipotong di batas policy retensi;
+        hari import di bawah batas itu sudah di-refresh import_history.
+        """
+        if not self.has_aggregates():
+            return 0
+        # bucket aggregate berbasis UTC: refresh hanya bucket yang utuh di dalam
+        # jendela, jadi jendela diperlebar satu hari di kedua sisi
+        lo = datetime.strptime(start_day, "%Y-%m-%d").date() - timedelta(days=1)
+        hi = datetime.strptime(end_day, "%Y-%m-%d").date() + timedelta(days=1)
+        floor = self._raw_retention_floor()
+        if floor is not None and lo < floor:
+            lo = floor
+        if lo >= hi:
+            return 0
+        self._refresh_aggregates([(lo, hi)])
+        return len(self.aggregates)
+
+    def fetch_topology(self):
+        return self.query("""
+            SELECT b.id as building_id, b.name as building_name, b.code as building_code,
+                   s.id as sensor_id, s.name as sensor_name
+            FROM buildings b
+            LEFT JOIN sensors s ON b.id = s.building_id
+            ORDER BY b.id;
+        """)
+
+    def has_aggregates(self):
+        """True bila continuous aggregate hourly_energy & daily_energy sudah ada (dicek sekali)"""
+        if self.aggregates is None:
+            rows = self.query("""
+                SELECT view_name FROM timescaledb_information.continuous_aggregates
+                WHERE view_name IN ('hourly_energy', 'daily_energy')
+            """)
+            self.aggregates = {row["view_name"] for row in rows}
+            if len(self.aggregates) < 2:
+                log.warning("continuous aggregate belum lengkap found=%s, query memakai hypertable mentah",
+                            sorted(self.aggregates))
+        return len(self.aggregates) == 2
+
+    def _range_query(self, start, end, sensor_filter="", filter_args=()):
+        """Total per sensor pada [start, end]: hari/jam penuh dari aggregate, tepi dari hypertable"""
+        if self.has_aggregates():
+            segments = self.split_range(start, end)
+        else:
+            segments = [("raw", start, end, True)]
+        parts, args = [], []
+        for source, lo, hi, inclusive in segments:
+            parts.append(self.RANGE_SOURCES[source].format(op="<=" if inclusive else "<") + sensor_filter)
+            args += [lo, hi, *filter_args]
+        union = " UNION ALL ".join(parts)
+        return self.query(f"""
+            SELECT sensor_id, SUM(energy) AS energy, SUM(cost) AS cost
+            FROM ({union}) AS segments
+            GROUP BY sensor_id
+        """, args)
+
+    def range_totals(self, sensor_id, start, end):
+        rows = self._range_query(start, end, " AND sensor_id = %s", (sensor_id,))
+        if not rows:
+            return 0.0, 0.0
+        return float(rows[0]["energy"] or 0), float(rows[0]["cost"] or 0)
+
+    def range_totals_by_sensor(self, start, end):
+        rows = self._range_query(start, end)
+        return {row["sensor_id"]: (float(row["energy"] or 0), float(row["cost"] or 0)) for row in rows}
+
+    def hourly_totals_by_sensor(self, start, end):
+        if self.has_aggregates():
+            rows = self.query("""
+                SELECT sensor_id, hour AS bucket, total_energy_kwh AS energy, total_cost AS cost
+                FROM hourly_energy
+                WHERE hour >= time_bucket('1 hour', %s::timestamptz) AND hour <= %s
+            """, (start, end))
+        else:
+            rows = self.query("""
+                SELECT sensor_id, time_bucket('1 hour', timestamp) AS bucket,
+                       SUM(energy) AS energy, SUM(cost) AS cost
+                FROM sensor_readings
+                WHERE timestamp BETWEEN %s AND %s
+                GROUP BY 1, 2
+            """, (start, end))
+        return [
+            (row["sensor_id"], row["bucket"], float(row["energy"] or 0), float(row["cost"] or 0))
+            for row in rows
+        ]
+
+    def hourly_energy(self, sensor_id, limit=60):
+        if self.has_aggregates():
+            rows = self.query("""
+                SELECT to_char(hour, 'HH24:MI') AS jam, SUM(total_energy_kwh) AS total_energy
+                FROM hourly_energy
+                WHERE sensor_id = %s
+                GROUP BY 1
+                ORDER BY 1 ASC
+                LIMIT %s
+            """, (sensor_id, limit))
+        else:
+            rows = self.query("""
+                SELECT
+                    to_char(time_bucket('1 hour', timestamp), 'HH24:MI') AS jam,
+                    SUM(energy) AS total_energy
+                FROM sensor_readings
+                WHERE sensor_id = %s
+                GROUP BY 1
+                ORDER BY 1 ASC
+                LIMIT %s
+            """, (sensor_id, limit))
+        return [(row["jam"], float(row["total_energy"] or 0)) for row in rows]
+
+    def _rollup_series(self, sensor_ids, metric, start, end, bucket_sec):
+        if not self.has_aggregates():
+            return self._raw_series(sensor_ids, metric, start, end, bucket_sec)
+        # continuous aggregate harian tidak menyimpan sample_count/sum_power: rata-rata hari = avg_power
+        branches = ["""
+            SELECT sensor_id, hour AS t, total_energy_kWh AS energy, total_cost AS cost,
+                   avg_power * sample_count AS sum_power, sample_count AS samples, avg_power, peak_power
+            FROM hourly_energy
+            WHERE sensor_id = ANY(%s) AND hour >= %s AND hour < %s
+        """]
+        lo = start.replace(minute=0, second=0, microsecond=0)
+        args = [list(sensor_ids), max(lo, self.hourly_floor or lo), end]
+        if self.hourly_floor is not None and lo < self.hourly_floor:
+            branches.append("""
+                SELECT sensor_id, date AS t, total_energy_kWh AS energy, total_cost AS cost,
+                       avg_power AS sum_power, 1 AS samples, avg_power, peak_power
+                FROM daily_energy
+                WHERE sensor_id = ANY(%s) AND date >= %s AND date < %s
+            """)
+            args += [list(sensor_ids), lo, min(self.hourly_floor, end)]
+        rows = self.query(rollup_series_sql(
+            metric, f"time_bucket({int(bucket_sec)} * INTERVAL '1 second', t)",
+            "(" + " UNION ALL ".join(branches) + ")"
+        ), args)
+        return [
+            (row["bucket"], float(row["value"] or 0), float(row["low"] or 0), float(row["high"] or 0))
+            for row in rows
+        ]
+
+    def _raw_series(self, sensor_ids, metric, start, end, bucket_sec):
+        rows = self.query(series_sql(
+            metric,
+            f"time_bucket({int(bucket_sec)} * INTERVAL '1 second', timestamp)",
+            "sensor_id = ANY(%s)",
+            "timestamp BETWEEN %s AND %s"
+        ), (list(sensor_ids), start, end))
+        return [
+            (row["bucket"], float(row["value"] or 0), float(row["low"] or 0), float(row["high"] or 0))
+            for row in rows
+        ]
+
+    def export_busy(self):
+        with self.export_lock:
+            return self.export_active >= self.export_maxconn
+
+    def iter_readings(self, sensor_ids, start, end, chunk_rows=5000):
+        # named cursor = server-side cursor: baris diambil per chunk_rows dari server.
+        # Koneksi sendiri di luar pool: download lambat tidak menahan koneksi pool
+        # yang dipakai query dashboard dan flush. Jumlahnya dibatasi export_slots;
+        # ekspor yang lolos cek export_busy bersamaan mengantre di sini.
+        if not self.export_slots.acquire(timeout=self.EXPORT_WAIT_SEC):
+            raise RuntimeError(f"semua {self.export_maxconn} slot ekspor terpakai")
+        with self.export_lock:
+            self.export_active += 1
+        conn = None
+        try:
+            conn = psycopg2.connect(**self.db_config)
+            cur = conn.cursor(name="pzem_export")
+            cur.itersize = chunk_rows
+            cur.execute("""
+                SELECT sensor_id, timestamp, voltage, current, power, energy, frequency, cost, power_factor
+                FROM sensor_readings
+                WHERE sensor_id = ANY(%s) AND timestamp >= %s AND timestamp < %s
+                ORDER BY timestamp, sensor_id
+            """, (list(sensor_ids), start, end))
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+            cur.close()
+            conn.commit()
+        finally:
+            if conn is not None:
+                conn.close()
+            with self.export_lock:
+                self.export_active -= 1
+            self.export_slots.release()
+
+    def apply_retention(self, raw_days, hourly_months):
+        """
+        Retensi & kompresi dijalankan oleh policy TimescaleDB (lihat timescale_migration);
+        di sini hanya laporan ukuran hypertable, kompresi dan status job policy.
+        """
+        started = time.monotonic()
+        size = self.query("SELECT hypertable_size('sensor_readings') AS bytes", one=True)
+        compression = self.query("""
+            SELECT before_compression_total_bytes AS before_bytes,
+                   after_compression_total_bytes AS after_bytes
+            FROM hypertable_compression_stats('sensor_readings')
+        """, one=True)
+        jobs = self.query("""
+            SELECT j.job_id, j.proc_name, j.hypertable_name, s.last_run_status,
+                   s.last_successful_finish, s.total_runs, s.total_failures,
+                   EXTRACT(EPOCH FROM s.last_run_duration) AS last_run_sec
+            FROM timescaledb_information.jobs j
+            LEFT JOIN timescaledb_information.job_stats s ON s.job_id = j.job_id
+            WHERE j.proc_name IN ('policy_retention', 'policy_compression')
+            ORDER BY j.job_id
+        """)
+        before = compression["before_bytes"] if compression else None
+        after = compression["after_bytes"] if compression else None
+        # policy membuang per chunk; batas di bawah ini konservatif (data di baliknya pasti masih ada)
+        now = self.now()
+        self.raw_floor = now - timedelta(days=raw_days)
+        self.hourly_floor = (now - timedelta(days=31 * hourly_months)).replace(hour=0, minute=0, second=0,
+                                                                              microsecond=0)
+        return {
+            "raw_days": raw_days,
+            "hourly_months": hourly_months,
+            "hypertable_bytes": int(size["bytes"] or 0) if size else 0,
+            "compressed_reclaimed_bytes": int(before - after) if before and after else 0,
+            "jobs": [dict(job) for job in jobs],
+            "seconds": round(time.monotonic() - started, 3)
+        }
+
+    def seed_if_empty(self, building_data=DEFAULT_BUILDINGS):
+        """Seed buildings & sensors if empty (safe)."""
+        row = self.query("SELECT COUNT(*) AS cnt FROM buildings;", one=True)
+        if row and int(row['cnt']) > 0:
+            log.info("seeder skipped: buildings already exist")
+            return False
+
+        conn = self.get_conn()
+        try:
+            cur = conn.cursor()
+            for name, code in building_data:
+                cur.execute(
+                    "INSERT INTO buildings (name, code) VALUES (%s, %s) RETURNING id;",
+                    (name, code)
+                )
+                building_id = cur.fetchone()[0]
+                cur.executemany(
+                    "INSERT INTO sensors (building_id, name) VALUES (%s, %s);",
+                    [(building_id, f"PZEM{i}") for i in range(1, 4)]
+                )
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.put_conn(conn)
+
+        log.info("seeder complete: buildings & sensors created")
+        return True
+
+    def close(self):
+        if self.pool:
+            self.pool.closeall()
+            self.pool = None
+
+
+# ======================== FACTORY ========================
+def create_backend(config):
+    """
+    Pilih backend dari config, contoh:
+      {"backend": "sqlite", "sqlite_path": "pzem.db", "sqlite_partition_dir": "pzem_partitions"}
+      {"backend": "timescale", "db_config": {...}, "pool_minconn": 1, "pool_maxconn": 10,
+       "export_maxconn": 2}
+    """
+    backend = config.get("backend", "sqlite")
+    if backend == "sqlite":
+        return SQLiteBackend(
+            config.get("sqlite_path", "pzem.db"),
+            partition_dir=config.get("sqlite_partition_dir"),
+            archive_dir=config.get("sqlite_archive_dir")
+        )
+    if backend == "timescale":
+        return TimescaleBackend(
+            config["db_config"],
+            minconn=config.get("pool_minconn", 1),
+            maxconn=config.get("pool_maxconn", 10),
+            export_maxconn=config.get("export_maxconn", 2)
+        )
+    raise ValueError(f"Backend storage tidak dikenal: {backend}")
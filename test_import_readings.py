@@ -0,0 +1,68 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import db_migration
+import import_readings
+from storage import SQLiteBackend
+
+BILLING = {"interval_sec": 3, "tarif_per_kwh": 1500, "ppj": 0.10}
+
+
+class BackdatedImportTest(unittest.TestCase):
+    """Import histori yang lebih tua dari rollup yang sudah ada harus masuk daily_energy"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        db_migration.DB_PATH = os.path.join(self.tmp, "pzem.db")
+        db_migration.migrate()
+        db_migration.seed()
+        self.backend = SQLiteBackend(db_migration.DB_PATH, os.path.join(self.tmp, "partitions"))
+
+    def tearDown(self):
+        self.backend.close()
+        shutil.rmtree(self.tmp)
+
+    def test_daily_totals_match_raw_energy(self):
+        today = self.backend.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        # rollup "sekarang" dari jalur live: jam tertua hourly_energy = hari ini
+        self.backend.write_readings([
+            (1, today + timedelta(minutes=m), 220.0, 1.0, 200.0, 0.01, 50.0, 15.0, 0.9) for m in range(3)
+        ])
+
+        start = today - timedelta(days=40)
+        path = os.path.join(self.tmp, "history.csv")
+        expected = {}
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["timestamp", "sensor_id", "voltage", "current", "power", "energy", "cost"])
+            for i in range(2 * 24 * 4):
+                ts = start + timedelta(minutes=15 * i)
+                energy = 0.001 * (i % 7 + 1)
+                writer.writerow([ts.isoformat(sep=" "), 1, 220, 1.5, 330, energy, energy * 1650])
+                day = ts.strftime("%Y-%m-%d")
+                expected[day] = expected.get(day, 0.0) + energy
+
+        report = import_readings.import_files(self.backend, [path], BILLING)
+        self.assertEqual(report["rows"], 2 * 24 * 4)
+
+        daily = {
+            row["date"]: row["total_energy_kWh"]
+            for row in self.backend.query(
+                "SELECT date, total_energy_kWh FROM daily_energy WHERE sensor_id = 1 AND date < ?",
+                (today.strftime("%Y-%m-%d"),))
+        }
+        self.assertEqual(sorted(daily), sorted(expected))
+        for day, energy in expected.items():
+            self.assertAlmostEqual(daily[day], energy, places=9)
+
+        energy, cost = self.backend.range_totals(1, start, start + timedelta(days=2) - timedelta(seconds=1))
+        self.assertAlmostEqual(energy, sum(expected.values()), places=9)
+        self.assertGreater(cost, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
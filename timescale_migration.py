@@ -9,6 +9,12 @@ DB_CONFIG = {
     "port": 5432
 }
 
+# Retensi: raw N hari, hourly_energy M bulan, daily_energy selamanya.
+# Samakan dengan RETENTION_CONFIG di server.py.
+RAW_RETENTION_DAYS = 90
+HOURLY_RETENTION_MONTHS = 12
+COMPRESS_AFTER_DAYS = 7
+
 
 def migrate():
     print("\n🚀 Menjalankan migrasi database TimescaleDB...")
@@ -84,6 +90,31 @@ def migrate():
         GROUP BY date, sensor_id
         WITH DATA;
     """)
+
+    # Aggregate per jam untuk dashboard (usage chart, pie, stats, realtime)
+    print("📈 Membuat continuous aggregate view (hourly_energy)...")
+    cur.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS hourly_energy
+        WITH (timescaledb.continuous) AS
+        SELECT
+            time_bucket('1 hour', timestamp) AS hour,
+            sensor_id,
+            SUM(energy) AS total_energy_kWh,
+            SUM(cost) AS total_cost,
+            AVG(power) AS avg_power,
+            MAX(power) AS peak_power,
+            COUNT(*) AS sample_count
+        FROM sensor_readings
+        GROUP BY hour, sensor_id
+        WITH DATA;
+    """)
+
+    # Real-time aggregation: bucket yang belum termaterialisasi dihitung dari hypertable
+    for view in ("hourly_energy", "daily_energy"):
+        cur.execute(
+            sql.SQL("ALTER MATERIALIZED VIEW {} SET (timescaledb.materialized_only = false);")
+            .format(sql.Identifier(view))
+        )
     cur.close()
     conn.close()
 
@@ -109,6 +140,37 @@ def migrate():
         END
         $$;
     """)
+    cur.execute("""
+        SELECT add_continuous_aggregate_policy(
+            'hourly_energy',
+            start_offset => INTERVAL '3 hours',
+            end_offset   => INTERVAL '1 hour',
+            schedule_interval => INTERVAL '5 minutes',
+            if_not_exists => TRUE
+        );
+    """)
+
+    # 7️⃣ Kompresi chunk lama + retensi (raw & hourly; daily_energy disimpan selamanya)
+    print("🗜️ Menambahkan compression & retention policy...")
+    cur.execute("""
+        ALTER TABLE sensor_readings SET (
+            timescaledb.compress,
+            timescaledb.compress_segmentby = 'sensor_id',
+            timescaledb.compress_orderby = 'timestamp DESC'
+        );
+    """)
+    cur.execute(
+        "SELECT add_compression_policy('sensor_readings', %s * INTERVAL '1 day', if_not_exists => TRUE);",
+        (COMPRESS_AFTER_DAYS,)
+    )
+    cur.execute(
+        "SELECT add_retention_policy('sensor_readings', %s * INTERVAL '1 day', if_not_exists => TRUE);",
+        (RAW_RETENTION_DAYS,)
+    )
+    cur.execute(
+        "SELECT add_retention_policy('hourly_energy', %s * INTERVAL '1 month', if_not_exists => TRUE);",
+        (HOURLY_RETENTION_MONTHS,)
+    )
     conn.commit()
     cur.close()
     conn.close()
@@ -0,0 +1,69 @@
+from collections import namedtuple
+
+# Snapshot topologi gedung/sensor yang immutable. Dibangun sekali dari join
+# buildings/sensors lalu di-swap utuh saat berubah; endpoint & jalur MQTT
+# hanya membaca referensi snapshot saat ini tanpa query atau membangun string.
+SensorInfo = namedtuple("SensorInfo", (
+    "sensor_id", "sensor_name", "topic", "phase_key",
+    "index",            # posisi di Topology.sensors
+    "building_index"    # posisi gedung di Topology.buildings
+))
+BuildingInfo = namedtuple("BuildingInfo", (
+    "building_id", "name", "code",
+    "index",            # posisi di Topology.buildings
+    "sensors"           # tuple SensorInfo
+))
+Topology = namedtuple("Topology", (
+    "buildings",        # tuple BuildingInfo, urut building id
+    "sensors",          # tuple SensorInfo semua gedung
+    "routes",           # topic -> sensor_id
+    "by_sensor_id",     # sensor_id -> SensorInfo
+    "signature"         # tuple mentah hasil join, untuk deteksi perubahan
+))
+
+PHASES = ('r', 's', 't')
+
+def sensor_topic(building_code, sensor_name):
+    return f"sensor/{building_code}/{sensor_name}"
+
+def phase_key(sensor_name):
+    """Fase dari char terakhir nama sensor bila r/s/t, selain itu nama sensor itu sendiri"""
+    last = sensor_name[-1].lower() if sensor_name else ""
+    return last if last in PHASES else sensor_name
+
+def build_topology(rows):
+    """Bangun Topology dari baris fetch_topology (building_id, building_name, building_code, sensor_id, sensor_name)"""
+    signature = tuple(
+        (row['building_id'], row['building_name'], row['building_code'], row['sensor_id'], row['sensor_name'])
+        for row in rows
+    )
+
+    grouped = {}
+    for building_id, building_name, building_code, sensor_id, sensor_name in signature:
+        entry = grouped.get(building_name)
+        if entry is None:
+            entry = grouped[building_name] = (building_id, building_code, [])
+        if sensor_id:
+            entry[2].append((sensor_id, sensor_name))
+
+    buildings = []
+    sensors = []
+    for building_index, (building_name, (building_id, building_code, members)) in enumerate(grouped.items()):
+        building_sensors = []
+        for sensor_id, sensor_name in members:
+            sensor = SensorInfo(sensor_id, sensor_name, sensor_topic(building_code, sensor_name),
+                                phase_key(sensor_name), len(sensors), building_index)
+            sensors.append(sensor)
+            building_sensors.append(sensor)
+        buildings.append(BuildingInfo(building_id, building_name, building_code,
+                                      building_index, tuple(building_sensors)))
+
+    return Topology(
+        buildings=tuple(buildings),
+        sensors=tuple(sensors),
+        routes={sensor.topic: sensor.sensor_id for sensor in sensors},
+        by_sensor_id={sensor.sensor_id: sensor for sensor in sensors},
+        signature=signature
+    )
+
+EMPTY_TOPOLOGY = build_topology([])